@@ -0,0 +1,149 @@
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from charts import _warm_renderer
+from history import ScanHistory
+from priority import PriorityRules
+from report import ReportGenerator
+from utils import get_df
+
+# Keys of a job of the manifest holding a path, relative to the manifest
+PATH_KEYS = ["cve", "cpe", "patch", "issue", "history"]
+
+
+def load_manifest(path):
+    """
+    Jobs of a json or toml manifest:
+
+        {"defaults": {...}, "jobs": [{"name": ..., "date": ..., "cve": ...}, ...]}
+
+    A job holds the name and date of its report, the paths of its exports (cve, cpe,
+    patch, issue, olds as a list and an optional history directory), and options,
+    keyword arguments of ReportGenerator overriding the ones of the command line.
+    The keys of defaults are those of every job. Relative paths are relative to the
+    manifest.
+    """
+    if path.endswith(".toml"):
+        import tomllib
+
+        with open(path, "rb") as f:
+            manifest = tomllib.load(f)
+    else:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    defaults = manifest.get("defaults", {})
+    jobs = []
+    for job in manifest.get("jobs", []):
+        job = {
+            **defaults,
+            **job,
+            "options": {**defaults.get("options", {}), **job.get("options", {})},
+        }
+        for key in [key for key in PATH_KEYS if job.get(key)]:
+            job[key] = os.path.join(base_dir, job[key])
+        olds = job.get("olds", [])
+        if isinstance(olds, str):
+            olds = olds.split(",") if olds else []
+        job["olds"] = [os.path.join(base_dir, old) for old in olds]
+        jobs.append(job)
+    return jobs
+
+
+def run_job(job, read_options, generator_options):
+    """
+    Generate the report and synthesis of a job of the manifest.
+
+    :return: dict of the name, date, duration in seconds, rows of the CVE scan and
+        error of the job, None when it succeeded
+    """
+    start = time.perf_counter()
+    result = {"name": job.get("name", ""), "date": job.get("date", ""), "rows": None}
+    try:
+        options = {**generator_options, **job["options"]}
+        if isinstance(options.get("priority_rules"), str):
+            options["priority_rules"] = PriorityRules.load(options["priority_rules"])
+        if "date_format" in options:
+            read_options = {**read_options, "date_format": options["date_format"]}
+        data_df, cpe_df, patch_df, issue_df, old_cve_dfs = get_df(
+            job["cve"],
+            job["cpe"],
+            job["patch"],
+            job["issue"],
+            ",".join(job["olds"]),
+            **read_options,
+        )
+        history = None
+        if job.get("history"):
+            history = ScanHistory(job["history"], depth=job.get("history_depth"))
+            old_cve_dfs = history.previous_scans(
+                data_df, old_cve_dfs, options.get("date_format", "%Y-%m-%d")
+            )
+        result["rows"] = len(data_df)
+        generator = ReportGenerator(
+            data_df, cpe_df, patch_df, issue_df, old_cve_dfs, **options
+        )
+        if history is not None:
+            history.record(
+                data_df,
+                old_cve_dfs,
+                options.get("date_format", "%Y-%m-%d"),
+                label=result["date"],
+            )
+        generator.generate_reports(result["name"], result["date"])
+        result["error"] = None
+    except Exception as e:
+        result["error"] = f"{e}\n{traceback.format_exc()}"
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def run_batch(jobs, read_options, generator_options, workers=0):
+    """
+    Run the jobs of a manifest, in a pool of workers processes sharing their warm
+    imports and renderer from one job to the next, or one after another in this
+    process when workers is 0. A failing job does not stop the others.
+
+    :return: list of the results of run_job, in the order of the jobs
+    """
+    start = time.perf_counter()
+    if workers:
+        with ProcessPoolExecutor(workers, initializer=_warm_renderer) as pool:
+            futures = [
+                pool.submit(run_job, job, read_options, generator_options)
+                for job in jobs
+            ]
+            results = []
+            for job, future in zip(jobs, futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:  # The worker died, BrokenProcessPool
+                    results.append(
+                        {
+                            "name": job.get("name", ""),
+                            "date": job.get("date", ""),
+                            "rows": None,
+                            "seconds": 0,
+                            "error": str(e),
+                        }
+                    )
+    else:
+        results = [run_job(job, read_options, generator_options) for job in jobs]
+
+    for result in results:
+        status = "failed" if result["error"] else "done"
+        print(
+            f"{result['name']} {result['date']}: {status} in {result['seconds']:.1f}s"
+            + (f", {result['rows']} rows" if result["rows"] is not None else "")
+        )
+        if result["error"]:
+            print(result["error"])
+    failed = sum(1 for result in results if result["error"])
+    print(
+        f"{len(results) - failed}/{len(results)} reports generated in "
+        f"{time.perf_counter() - start:.1f}s"
+    )
+    return results
@@ -0,0 +1,230 @@
+"""
+Generator of synthetic Cyberwatch exports: a CVE export and its older scans, and the
+CPE, Patch and Security Issue exports, in the format read by read_csv_file_from_path
+(";" separated, decimal comma, "Undefined"/"None" scores, missing dates).
+
+Every server of a domain hosts some components, and is affected by every CVE of
+their product. Older scans are derived from the newer one: some vulnerabilities
+are not there yet, others have been fixed since, and EPSS, scores, maturity and
+Cisa references drift.
+
+Usage: python benchmarks/generate.py out_dir [servers] [cves] [components]
+    [domains] [depth] [components_per_server]
+"""
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+MATURITIES = ["high", "functional", "proof-of-concept", "unproven"]
+CWE_CODES = [f"CWE-{code}" for code in (20, 22, 78, 79, 89, 119, 125, 287, 416, 787)]
+CWE_CODES += ["NVD-CWE-noinfo", "NVD-CWE-Other"]
+CAPECS = [f"CAPEC-{code} / Attack pattern {code}" for code in (10, 63, 66, 100, 242)]
+
+
+def decimal_comma(values, decimals):
+    """Scores as written by the export, 7,3."""
+    text = np.char.mod(f"%.{decimals}f", np.asarray(values, dtype=np.float64))
+    return pd.Series(
+        np.char.replace(text, ".", ","), index=getattr(values, "index", None)
+    )
+
+
+def criticity(scores):
+    return np.select(
+        [scores >= 9, scores >= 7, scores >= 4], ["C1", "C2", "C3"], default="C4"
+    )
+
+
+def make_catalog(rng, cves, components):
+    """One product per component, every CVE affects the product of one component."""
+    catalog = pd.DataFrame(
+        {
+            "Component": [f"component-{i}" for i in range(components)],
+            "Product": [
+                f"product-{i % max(components // 2, 1)}" for i in range(components)
+            ],
+            "Version": [
+                f"{rng.integers(1, 5)}.{rng.integers(0, 20)}" for _ in range(components)
+            ],
+        }
+    )
+    years = rng.integers(2015, 2025, cves)
+    vulnerabilities = pd.DataFrame(
+        {
+            "CVE Code": [f"CVE-{year}-{i + 1000}" for i, year in enumerate(years)],
+            "Component": rng.integers(0, components, cves),
+            "Published": pd.to_datetime(years.astype(str))
+            + pd.to_timedelta(rng.integers(0, 365, cves), unit="D"),
+            "CVSS Score": rng.integers(10, 101, cves) / 10,
+            "Score EPSS": rng.beta(0.3, 3, cves),
+            "Maturity": rng.choice(MATURITIES, cves, p=[0.05, 0.15, 0.3, 0.5]),
+            "Cisa Reference": rng.choice(["Yes", "No"], cves, p=[0.05, 0.95]),
+            "CWE Code": rng.choice(CWE_CODES, cves),
+            "Related CAPECs": rng.choice(CAPECS + [""], cves),
+        }
+    )
+    return catalog, vulnerabilities
+
+
+def make_scan(rng, servers, domains, catalog, vulnerabilities, components_per_server):
+    """Rows of the newest scan, one per server, component and CVE."""
+    server_ids = np.repeat(np.arange(servers), components_per_server)
+    hosted = pd.DataFrame(
+        {
+            "server": server_ids,
+            "Component": rng.integers(0, len(catalog), len(server_ids)),
+        }
+    ).drop_duplicates()
+    scan = hosted.merge(vulnerabilities, on="Component")
+    scan["Domain"] = [f"domain-{server % domains}" for server in scan["server"]]
+    scan["Server"] = [
+        f"server-{server}.{domain}"
+        for server, domain in zip(scan["server"], scan["Domain"])
+    ]
+    scan = scan.join(catalog, on="Component", rsuffix="_name")
+    scan["Component"] = scan["Component_name"]
+    return scan.drop(columns=["server", "Component_name"]).reset_index(drop=True)
+
+
+def older_scan(rng, scan, vulnerabilities, fixed_rate=0.05, new_rate=0.03):
+    """
+    Scan preceding scan: without the rows new in scan, with rows fixed since then,
+    and with drifted EPSS, scores, maturity and Cisa references.
+    """
+    kept = scan[rng.random(len(scan)) >= new_rate]
+    fixed = scan.sample(frac=fixed_rate, random_state=int(rng.integers(1 << 31)))
+    fixed = fixed.assign(
+        **{"CVE Code": rng.choice(vulnerabilities["CVE Code"], len(fixed))}
+    )
+    older = pd.concat([kept, fixed], ignore_index=True)
+    older = older.drop_duplicates(subset=["Server", "CVE Code", "Component"])
+    drift = rng.random(len(older)) < 0.1
+    older.loc[drift, "Score EPSS"] = rng.beta(0.3, 3, drift.sum())
+    drift = rng.random(len(older)) < 0.02
+    older.loc[drift, "CVSS Score"] = rng.integers(10, 101, drift.sum()) / 10
+    drift = rng.random(len(older)) < 0.02
+    older.loc[drift, "Maturity"] = rng.choice(MATURITIES, drift.sum())
+    drift = rng.random(len(older)) < 0.01
+    older.loc[drift, "Cisa Reference"] = "No"
+    return older.reset_index(drop=True)
+
+
+def export(rng, scan):
+    """The columns of a CVE export, in its order and format."""
+    n = len(scan)
+    temporal = scan["CVSS Score"] - rng.integers(0, 10, n) / 10
+    environmental = scan["CVSS Score"] - rng.integers(0, 20, n) / 10
+    computed = np.minimum(temporal, environmental)
+    published = (
+        scan["Published"].dt.strftime("%Y-%m-%d").where(rng.random(n) >= 0.02, "")
+    )
+    df = pd.DataFrame(
+        {
+            "Published Date": published,
+            "Last Reviewed Date": "2024-06-01",
+            "Domain": scan["Domain"],
+            "Surface": rng.choice(["external", "internal"], n),
+            "Server": scan["Server"],
+            "CVE Code": scan["CVE Code"],
+            "CVSS Score": decimal_comma(scan["CVSS Score"], 1),
+            # A column holding "Undefined" is read as text, so its decimal commas
+            # are never converted: such columns only hold integers in the exports
+            "CVSS Temporal Score": pd.Series(
+                np.floor(temporal).astype(int).astype(str)
+            ).where(rng.random(n) >= 0.05, rng.choice(["Undefined", "None"], n)),
+            "CVSS Environmental Score": decimal_comma(environmental, 1),
+            "CVSS Computed Score": decimal_comma(computed, 1),
+            "Criticity": criticity(computed.to_numpy()),
+            "Component": scan["Component"],
+            "Product": scan["Product"],
+            "Version": scan["Version"],
+            "Patch": pd.Series(scan["Version"] + ".1").where(rng.random(n) >= 0.3, ""),
+            "Score EPSS": decimal_comma(scan["Score EPSS"], 5),
+            "Maturity": scan["Maturity"],
+            "Content": "Vulnerability of "
+            + scan["Product"]
+            + " allowing remote attackers to execute code; see references",
+            "Vector": "CVSS:3.1/AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H",
+            "Environmental Vector": "CVSS:3.1/MAV:N/MAC:L",
+            "Temporal Vector": "CVSS:3.1/E:U/RL:O/RC:C",
+            "CWE Code": scan["CWE Code"],
+            "Related CWEs": scan["CWE Code"],
+            "Related CAPECs": scan["Related CAPECs"],
+            "Related ATK": "",
+            "Cisa Reference": scan["Cisa Reference"],
+            "CertFR References": "",
+        }
+    )
+    return df.sample(frac=1, random_state=int(rng.integers(1 << 31)))
+
+
+def write_csv(df, path):
+    df.to_csv(path, sep=";", index=False, encoding="utf-8")
+
+
+def generate(
+    out_dir,
+    servers=200,
+    cves=2000,
+    components=100,
+    domains=5,
+    depth=3,
+    components_per_server=10,
+    seed=0,
+):
+    """
+    Write cve.csv, old1.csv (the most recent old scan) to old{depth}.csv, cpe.csv,
+    patch.csv and issue.csv in out_dir.
+
+    :return: dict of the paths of the exports, "olds" being the "," separated paths
+        expected by -olds
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    catalog, vulnerabilities = make_catalog(rng, cves, components)
+    scan = make_scan(
+        rng, servers, domains, catalog, vulnerabilities, components_per_server
+    )
+    paths = {"cve": os.path.join(out_dir, "cve.csv")}
+    write_csv(export(rng, scan), paths["cve"])
+    old_paths = []
+    for i in range(1, depth + 1):
+        scan = older_scan(rng, scan, vulnerabilities)
+        old_paths.append(os.path.join(out_dir, f"old{i}.csv"))
+        write_csv(export(rng, scan), old_paths[-1])
+    paths["olds"] = ",".join(old_paths)
+
+    latest = pd.read_csv(
+        paths["cve"],
+        sep=";",
+        usecols=["Server", "Product", "Version", "CVE Code", "Patch", "Domain"],
+    )
+    cpe = latest.groupby(["Product", "Version"]).size().reset_index(name="Total")
+    patch = (
+        latest[latest["Patch"].notna()]
+        .groupby(["Product", "Patch"])["CVE Code"]
+        .nunique()
+        .reset_index(name="CVE Number")
+    )
+    issues = latest.drop_duplicates("Server")[["Domain", "Server"]].sample(
+        frac=0.1, random_state=seed
+    )
+    issues["Issue"] = rng.choice(
+        ["Obsolete OS", "Obsolete application", "Weak TLS"], len(issues)
+    )
+    for name, df in [("cpe", cpe), ("patch", patch), ("issue", issues)]:
+        paths[name] = os.path.join(out_dir, f"{name}.csv")
+        write_csv(df, paths[name])
+    return paths
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    sizes = [int(arg) for arg in sys.argv[2:]]
+    paths = generate(sys.argv[1], *sizes)
+    for name, path in paths.items():
+        print(f"{name}: {path}")
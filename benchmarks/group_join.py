@@ -0,0 +1,65 @@
+"""
+Benchmark of the " | " join aggregations of group_df: the former per group lambdas
+against the vectorized join_by_group.
+
+Usage: python benchmarks/group_join.py [rows] [groups]
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report import DISTINCT_JOIN, JOIN, aggregate  # noqa: E402
+
+LAMBDAS = {
+    DISTINCT_JOIN: lambda x: " | ".join(x.astype(str).unique()),
+    JOIN: lambda x: " | ".join(x.astype(str)),
+}
+
+
+def make_frame(rows, groups, seed=0):
+    rng = np.random.default_rng(seed)
+    servers = np.array([f"srv{i}" for i in range(max(groups // 10, 2))], dtype=object)
+    servers[0] = np.nan  # Missing values are joined as "nan"
+    return pd.DataFrame(
+        {
+            "CVE Code": [f"CVE-2024-{i}" for i in rng.integers(0, groups, rows)],
+            "Server": pd.Categorical(servers[rng.integers(0, len(servers), rows)]),
+            "Component": rng.choice(["openssl", "bash", 1, "1", 2.5], rows),
+            "Patch": rng.choice(["None", "1.2.3", "4.5"], rows),
+        }
+    )
+
+
+def run(rows, groups):
+    df = make_frame(rows, groups)
+    agg = {"Server": DISTINCT_JOIN, "Component": DISTINCT_JOIN, "Patch": JOIN}
+
+    start = time.perf_counter()
+    expected = (
+        df.groupby(["CVE Code"], observed=True)
+        .agg({col: LAMBDAS[rule] for col, rule in agg.items()})
+        .reset_index()
+    )
+    lambdas_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = aggregate(df, ["CVE Code"], agg)
+    vectorized_time = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(result, expected)
+    print(
+        f"{rows:>9} rows {groups:>7} groups: lambdas {lambdas_time:8.3f}s, "
+        f"vectorized {vectorized_time:8.3f}s ({lambdas_time / vectorized_time:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]), int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
+    else:
+        for rows, groups in [(10_000, 1_000), (100_000, 10_000), (300_000, 30_000)]:
+            run(rows, groups)
@@ -0,0 +1,241 @@
+"""
+Benchmark of the whole report pipeline on synthetic exports (see generate.py).
+
+Every scale runs in its own process, on exports generated in a temporary directory.
+Each stage is timed: ingest (get_df), parse_dataframe, compute_dataframe, group_df,
+the Excel write, load_workbook, the formatting, the charts, the saves and the
+synthesis, with the peak RSS of the process at the end of the stage. A stage
+called from another one is counted in the outer one, group_df in the synthesis
+for instance.
+
+Results are compared with benchmarks/baseline.json: stages slower than the
+tolerance and changed row counts are reported, and the exit status is 1.
+
+With --low-memory, every scale also runs without it and the peak RSS saved by the
+low memory mode is printed.
+
+Usage: python benchmarks/pipeline.py [scale ...] [--save-baseline] [--stream]
+    [--low-memory] [--tolerance 0.2]
+Scales: small, medium, large, default is small and medium.
+"""
+
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+BASELINE = os.path.join(BENCHMARKS_DIR, "baseline.json")
+
+# Arguments of generate.generate
+SCALES = {
+    "small": dict(servers=50, cves=500, components=40, domains=3, depth=2),
+    "medium": dict(servers=300, cves=2000, components=100, domains=5, depth=3),
+    "large": dict(servers=1000, cves=5000, components=200, domains=10, depth=5),
+}
+
+
+class Stages:
+    """Wall time and peak RSS of the stages, the outermost stage of a call counts."""
+
+    def __init__(self):
+        self.times = {}
+        self.peaks = {}
+        self.active = None
+
+    def wrap(self, owner, name, stage):
+        function = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            if self.active is not None:
+                return function(*args, **kwargs)
+            self.active = stage
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.times[stage] = self.times.get(stage, 0) + (
+                    time.perf_counter() - start
+                )
+                self.peaks[stage] = peak_rss_mb()
+                self.active = None
+
+        setattr(owner, name, timed)
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_scale(data_dir, stream=False, low_memory=False):
+    """Run the pipeline on the exports of data_dir, in this process."""
+    import openpyxl
+    import report
+    import utils
+    from cache import ChartCache
+
+    stages = Stages()
+    stages.wrap(utils, "get_df", "ingest")
+    stages.wrap(report, "parse_dataframe", "parse_dataframe")
+    stages.wrap(report, "compute_dataframe", "compute_dataframe")
+    stages.wrap(report, "compute_scans", "compute_dataframe")
+    stages.wrap(report, "group_df", "group_df")
+    stages.wrap(report.ReportGenerator, "write_to_excel", "excel_write")
+    stages.wrap(report.ReportGenerator, "stream_sheet", "excel_write")
+    stages.wrap(report, "load_workbook", "load_workbook")
+    stages.wrap(report.ReportGenerator, "add_table_from_df", "formatting")
+    stages.wrap(report.ReportGenerator, "apply_conditional_formatting", "formatting")
+    stages.wrap(report.ReportGenerator, "apply_charts", "charts")
+    stages.wrap(openpyxl.Workbook, "save", "save")
+    stages.wrap(report.ReportGenerator, "generate_synthesis", "synthesis")
+
+    paths = {
+        name: os.path.join(data_dir, f"{name}.csv")
+        for name in ["cve", "cpe", "patch", "issue"]
+    }
+    olds = sorted(
+        (name for name in os.listdir(data_dir) if name.startswith("old")),
+        key=lambda name: int(name[3:-4]),
+    )
+    old_paths = ",".join(os.path.join(data_dir, name) for name in olds)
+
+    start = time.perf_counter()
+    data_df, cpe_df, patch_df, issue_df, old_cve_dfs = utils.get_df(
+        paths["cve"], paths["cpe"], paths["patch"], paths["issue"], old_paths
+    )
+    rows = {"cve": len(data_df), "olds": sum(len(df) for df in old_cve_dfs)}
+    generator = report.ReportGenerator(
+        data_df,
+        cpe_df,
+        patch_df,
+        issue_df,
+        old_cve_dfs,
+        groupby=["CVE Code"],
+        stream=stream,
+        low_memory=low_memory,
+        chart_cache=ChartCache(os.path.join(data_dir, "charts")),
+    )
+    rows["cve scan"] = len(generator.cve_df)
+    generator.generate_report("AUDIT_BENCH", "2024")
+    generator.generate_synthesis("AUDIT_SYNTHESIS_BENCH", "2024")
+    total = time.perf_counter() - start
+    return {
+        "stages": {stage: round(seconds, 3) for stage, seconds in stages.times.items()},
+        "stage_peak_rss_mb": {
+            stage: round(peak, 1) for stage, peak in stages.peaks.items()
+        },
+        "other": round(total - sum(stages.times.values()), 3),
+        "total": round(total, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "rows": rows,
+    }
+
+
+def run_in_process(scale, stream=False, low_memory=False):
+    """Generate the exports of scale and run the pipeline on them in a new process."""
+    from generate import generate
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        generate(data_dir, **SCALES[scale])
+        command = [sys.executable, os.path.abspath(__file__), "--run", data_dir]
+        if stream:
+            command.append("--stream")
+        if low_memory:
+            command.append("--low-memory")
+        process = subprocess.run(command, cwd=data_dir, capture_output=True, text=True)
+        if process.returncode != 0:
+            raise RuntimeError(f"{scale} failed:\n{process.stderr}")
+        return json.loads(process.stdout.splitlines()[-1])
+
+
+def compare(scale, result, baseline, tolerance):
+    """Print the result against the baseline, return the regressions."""
+    regressions = []
+    print(f"== {scale}: {result['rows']}")
+    for stage, seconds in list(result["stages"].items()) + [("total", result["total"])]:
+        line = f"{stage:>20} {seconds:9.3f}s"
+        reference = (baseline or {}).get("stages", {}).get(stage)
+        if stage == "total" and baseline:
+            reference = baseline["total"]
+        if reference:
+            ratio = seconds / reference
+            line += f"  baseline {reference:9.3f}s  {ratio:5.2f}x"
+            if ratio > 1 + tolerance:
+                line += "  SLOWER"
+                regressions.append(f"{scale} {stage}")
+        print(line)
+    line = f"{'peak RSS':>20} {result['peak_rss_mb']:9.1f}MB"
+    if baseline:
+        line += f"  baseline {baseline['peak_rss_mb']:9.1f}MB"
+        if result["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance):
+            line += "  LARGER"
+            regressions.append(f"{scale} peak RSS")
+        if result["rows"] != baseline["rows"]:
+            print(f"{'rows':>20} differ from the baseline {baseline['rows']}")
+            regressions.append(f"{scale} rows")
+    print(line)
+    return regressions
+
+
+def main(args):
+    if "--run" in args:
+        data_dir = args[args.index("--run") + 1]
+        # The pipeline prints its progress, only the result goes to stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            result = run_scale(
+                data_dir, stream="--stream" in args, low_memory="--low-memory" in args
+            )
+        print(json.dumps(result))
+        return 0
+
+    tolerance = 0.2
+    if "--tolerance" in args:
+        tolerance = float(args[args.index("--tolerance") + 1])
+    scales = [arg for arg in args if arg in SCALES] or ["small", "medium"]
+    baselines = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE, encoding="utf-8") as f:
+            baselines = json.load(f)
+
+    stream, low_memory = "--stream" in args, "--low-memory" in args
+    mode = "-".join(
+        name
+        for name, enabled in [("stream", stream), ("low-memory", low_memory)]
+        if enabled
+    )
+    mode = mode or "default"
+    results = {}
+    regressions = []
+    for scale in scales:
+        results[scale] = run_in_process(scale, stream=stream, low_memory=low_memory)
+        baseline = baselines.get(mode, {}).get(scale)
+        regressions += compare(scale, results[scale], baseline, tolerance)
+        if low_memory:
+            reference = run_in_process(scale, stream=stream)
+            saved = reference["peak_rss_mb"] - results[scale]["peak_rss_mb"]
+            print(
+                f"{'peak RSS saved':>20} {saved:9.1f}MB"
+                f"  ({reference['peak_rss_mb']:.1f}MB without --low-memory)"
+            )
+
+    if "--save-baseline" in args:
+        baselines.setdefault(mode, {}).update(results)
+        with open(BASELINE, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2)
+        print(f"Baseline saved to {BASELINE}")
+        return 0
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,155 @@
+"""
+Benchmark of the scan diff of compute_dataframe: the former merge of the whole
+scans against the key-indexed diff_scans.
+
+Usage: python benchmarks/scan_diff.py [rows]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from diff import MATURITY_LEVELS, UPDATE_COLUMNS, diff_scans  # noqa: E402
+from schema import (  # noqa: E402
+    COLUMN_TYPES,
+    SCORE,
+    is_categorical,
+    widen_scores,
+)
+
+SCORE_COL = "CVSS Computed Score"
+
+
+def not_equal(left, right):
+    """left != right, categoricals can only be compared when they share their categories."""
+    if is_categorical(left) or is_categorical(right):
+        left, right = left.astype(object), right.astype(object)
+    return left != right
+
+
+def get_news_from_scans_vectorized(
+    merged_df: pd.DataFrame, score_col: str
+) -> pd.DataFrame:
+    merged_df["Status"] = "Known"
+    update_cols = ["Update Cisa", "Update EPSS", "Update CVSS", "Update Maturity"]
+    merged_df[update_cols] = ""
+
+    # Define conditions for updates
+    update_conditions = [
+        not_equal(merged_df[col], merged_df[col + "_old"])
+        for col in ["Cisa Reference", "Maturity", "Score EPSS", score_col]
+    ]
+
+    # Apply the conditions to set the status
+    merged_df.loc[pd.concat(update_conditions, axis=1).any(axis=1), "Status"] = (
+        "Updated"
+    )
+    merged_df.loc[merged_df[score_col + "_old"].isna(), "Status"] = "New"
+    updated_df = merged_df.loc[~merged_df[score_col + "_old"].isna()]
+
+    if "Cisa Reference" in updated_df.columns:
+        cisa_condition = not_equal(
+            updated_df["Cisa Reference"], updated_df["Cisa Reference_old"]
+        )
+        updated_df.loc[cisa_condition, "Update Cisa"] = (
+            updated_df.loc[cisa_condition, "Cisa Reference"]
+            .astype(object)
+            .map({"Yes": "Added", "No": "Removed"})
+        )
+
+    if "Score EPSS" in updated_df.columns:
+        score_diff = widen_scores(updated_df["Score EPSS"]) - widen_scores(
+            updated_df["Score EPSS_old"]
+        )
+        updated_df.loc[score_diff != 0, "Update EPSS"] = score_diff
+
+    if score_col in updated_df.columns:
+        custom_score_diff = widen_scores(updated_df[score_col]) - widen_scores(
+            updated_df[score_col + "_old"]
+        )
+        updated_df.loc[custom_score_diff != 0, "Update CVSS"] = custom_score_diff
+
+    if "Maturity" in updated_df.columns:
+        maturity = updated_df["Maturity"].astype(object)
+        maturity_old = updated_df["Maturity_old"].astype(object)
+        maturity_diff = maturity.map(MATURITY_LEVELS) - maturity_old.map(
+            MATURITY_LEVELS
+        )
+        updated_df.loc[maturity_diff != 0, "Update Maturity"] = (
+            maturity_old + " -> " + maturity
+        )
+
+    merged_df[update_cols] = updated_df[update_cols]
+    return merged_df
+
+
+def merge_scans(dataframe, old_df, score_col):
+    merged_df = dataframe.merge(
+        old_df,
+        on=["Server", "CVE Code", "Component"],
+        suffixes=("", "_old"),
+        how="left",
+    )
+    merged_df = get_news_from_scans_vectorized(merged_df, score_col)
+    return merged_df[["Status"] + UPDATE_COLUMNS]
+
+
+def make_scan(rows, seed=0, width=20):
+    """Scan with unique keys and the columns of an export, padded to width columns."""
+    rng = np.random.default_rng(seed)
+    keys = rng.choice(rows * 2, rows, replace=False)
+    df = pd.DataFrame(
+        {
+            "Server": [f"srv{key % 500}" for key in keys],
+            "CVE Code": [f"CVE-2024-{key // 500}" for key in keys],
+            "Component": [f"comp{key % 7}" for key in keys],
+            "Cisa Reference": rng.choice(["Yes", "No"], rows, p=[0.05, 0.95]),
+            "Maturity": rng.choice(list(MATURITY_LEVELS), rows),
+            "Score EPSS": rng.integers(0, 100000, rows) / 100000,
+            SCORE_COL: rng.integers(0, 100, rows) / 10,
+        }
+    )
+    for i in range(width - len(df.columns)):
+        df[f"Column {i}"] = "x" * 40
+    df = df.astype({col: COLUMN_TYPES.get(col, object) for col in df.columns})
+    return df.astype({"Score EPSS": SCORE, SCORE_COL: SCORE})
+
+
+def measure(function, *args):
+    """Result, time and peak traced memory of function, measured in separate calls."""
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+
+def run(rows):
+    df = make_scan(rows, seed=0)
+    old_df = make_scan(rows, seed=1)
+
+    expected, merge_time, merge_peak = measure(merge_scans, df, old_df, SCORE_COL)
+    result, diff_time, diff_peak = measure(diff_scans, df, old_df, SCORE_COL)
+
+    # Unique keys and no missing scores, both engines agree
+    pd.testing.assert_frame_equal(result, expected.astype(object))
+    print(
+        f"{rows:>9} rows: merge {merge_time:7.3f}s {merge_peak:8.1f}MB, "
+        f"diff_scans {diff_time:7.3f}s {diff_peak:8.1f}MB "
+        f"({merge_time / diff_time:.1f}x faster, {merge_peak / diff_peak:.1f}x less memory)"
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        for rows in [10_000, 100_000, 500_000]:
+            run(rows)
@@ -0,0 +1,190 @@
+import hashlib
+import os
+import tempfile
+import time
+import pandas as pd
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Mode of the entries, the one of a file created with open under the umask, the
+# temporary files they are written to being readable by their owner only
+UMASK = os.umask(0)
+os.umask(UMASK)
+ENTRY_MODE = 0o666 & ~UMASK
+
+
+def file_hash(path, salt=""):
+    """Hash of the content of a file, salted with the options it is read with."""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(salt.encode("utf-8"))
+    with open(path, "rb") as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FileCache:
+    """
+    Directory of files named by the hash of their content or of their source,
+    evicted by age and then from the least recently used until it fits its size.
+    """
+
+    EXTENSION = ""
+
+    def __init__(self, path, max_size_mb, max_age_days=None):
+        """
+        :param path: str, directory where the entries are stored
+        :param max_size_mb: float, total size above which the oldest entries are evicted
+        :param max_age_days: float, age after which an unused entry is evicted,
+            default is never
+        """
+        self.path = path
+        self.max_size = max_size_mb * 1024 * 1024
+        self.max_age = max_age_days * 24 * 3600 if max_age_days else None
+        os.makedirs(self.path, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key + self.EXTENSION)
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith(self.EXTENSION):
+                full_path = os.path.join(self.path, name)
+                try:
+                    stat = os.stat(full_path)
+                except FileNotFoundError:  # Evicted by another reader
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, full_path))
+        return sorted(entries)
+
+    def _store(self, entry_path, write):
+        """Write an entry with write(tmp_path), it only appears once complete."""
+        # Unique temporary file, the same entry may be written twice at once
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.chmod(tmp_path, ENTRY_MODE)
+            os.replace(tmp_path, entry_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def evict(self):
+        """Remove expired entries, then the oldest ones until the cache fits its size."""
+        now = time.time()
+        entries = []
+        for mtime, size, entry_path in self._entries():
+            if self.max_age is not None and now - mtime > self.max_age:
+                self._remove(entry_path)
+            else:
+                entries.append((size, entry_path))
+        total = sum(size for size, _ in entries)
+        for size, entry_path in entries:
+            if total <= self.max_size:
+                break
+            self._remove(entry_path)
+            total -= size
+
+    @staticmethod
+    def _remove(entry_path):
+        try:
+            os.remove(entry_path)
+        except FileNotFoundError:  # Evicted by another reader
+            pass
+
+    def purge(self):
+        """Remove every entry of the cache."""
+        for _, _, entry_path in self._entries():
+            self._remove(entry_path)
+        print(f"Cache {self.path} purged")
+
+
+class ScanCache(FileCache):
+    """
+    On-disk cache of parsed scan exports.
+
+    Every entry is a Parquet file holding the frame returned by parse_dataframe,
+    keyed by the content hash of the csv and the date format used to parse it,
+    so an export is only parsed once whatever its path or name.
+    """
+
+    EXTENSION = ".parquet"
+
+    def __init__(self, path=".report_cache", max_size_mb=2048, max_age_days=30):
+        super().__init__(path, max_size_mb, max_age_days)
+
+    def key(self, csv_path, date_format, tag=""):
+        """Hash the content of the csv together with the date format and the reader tag."""
+        return file_hash(csv_path, salt=f"{date_format}|{tag}")
+
+    def load(self, csv_path, date_format, reader, tag=""):
+        """
+        Return the parsed frame of csv_path, from the cache when possible.
+
+        :param reader: callable reading the raw csv when the entry is missing
+        :param tag: str, identifies the frames produced by the reader
+        """
+        # Imported here, report imports the charts which use the chart cache
+        from report import parse_dataframe
+
+        key = self.key(csv_path, date_format, tag)
+        entry_path = self._entry_path(key)
+        if os.path.exists(entry_path):
+            try:
+                df = self._read(entry_path)
+                os.utime(entry_path)  # Keep recently used entries on eviction
+                print(f"Loaded {csv_path} from cache")
+                df.attrs["date_format"] = date_format
+                return df
+            except Exception as e:
+                print(f"Error reading cache entry for {csv_path}: {e}")
+
+        df = reader(csv_path)
+        parse_dataframe(df, format=date_format)
+        self._write(df, entry_path)
+        self.evict()
+        return df
+
+    def _read(self, entry_path):
+        return pd.read_parquet(entry_path)
+
+    def _write(self, df, entry_path):
+        try:
+            self._store(entry_path, lambda path: df.to_parquet(path, index=False))
+        except Exception as e:
+            print(f"Error writing cache entry: {e}")
+
+
+class ChartCache(FileCache):
+    """
+    On-disk cache of the rendered charts.
+
+    Every entry is a PNG keyed by the hash of the figure spec, its data, layout and
+    image size, so a chart is only rendered again when what it shows changes.
+    """
+
+    EXTENSION = ".png"
+
+    def __init__(self, path=".chart_cache", max_size_mb=256):
+        super().__init__(path, max_size_mb)
+
+    def key(self, fig_json, width, height):
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{width}x{height}|".encode("utf-8"))
+        digest.update(fig_json.encode("utf-8"))
+        return digest.hexdigest()
+
+    def lookup(self, fig_json, width, height):
+        """
+        Path of the entry of a figure, and whether it is already rendered.
+        """
+        entry_path = self._entry_path(self.key(fig_json, width, height))
+        if not os.path.exists(entry_path):
+            return entry_path, False
+        try:
+            os.utime(entry_path)  # Keep recently used entries on eviction
+        except FileNotFoundError:  # Evicted by another run
+            return entry_path, False
+        return entry_path, True
@@ -1,7 +1,93 @@
 import plotly.express as px
 import plotly.io as pio
+import numpy as np
 import pandas as pd
-import os
+from cache import ChartCache
+from concurrent.futures import ProcessPoolExecutor
+from schema import SCORE_COLUMNS, is_categorical, widen_scores
+
+# CWE codes without information, not shown in the CWE and CAPEC charts
+NO_CWE = ["NVD-CWE-noinfo", "NVD-CWE-Other"]
+
+
+def _warm_renderer():
+    """Start the image renderer of a worker before it receives its first figure."""
+    try:
+        pio.to_image(px.bar(x=[0], y=[0]), format="png")
+    except Exception:
+        pass
+
+
+def _render_figure(cache, fig, entry_path, width, height):
+    """Render a figure, or its dict, in its cache entry, return the error if any."""
+    try:
+        cache._store(
+            entry_path,
+            lambda path: pio.write_image(
+                fig, path, format="png", width=width, height=height
+            ),
+        )
+    except Exception as e:
+        return str(e)
+    return None
+
+
+def renderer_pool(jobs):
+    """Pool of jobs processes exporting the figures, each with a warm renderer."""
+    return ProcessPoolExecutor(max_workers=jobs, initializer=_warm_renderer)
+
+
+class ChartCube:
+    """
+    Counts and score sums of a scan over the dimensions of the charts, computed in a
+    single groupby of the scan. Charts roll the cube up to their own dimensions
+    instead of grouping the whole scan again.
+    """
+
+    DIMENSIONS = ["Domain", "Server", "Priority", "Criticity"]
+
+    def __init__(self, df):
+        self.dimensions = [dim for dim in self.DIMENSIONS if dim in df.columns]
+        self.scores = [col for col in SCORE_COLUMNS if col in df.columns]
+        self.cells = None
+        if not self.dimensions:
+            return
+        # Missing values are kept as cells, the groupbys of counts and mean drop
+        # them per dimension with their default dropna=True
+        grouped = df.groupby(self.dimensions, observed=True, dropna=False)
+        group_codes = grouped.ngroup().to_numpy(dtype=np.int64)
+        self.cells = grouped.size().reset_index(name="Counts")
+        for col in self.scores:
+            scores = widen_scores(df[col]).to_numpy(dtype=np.float64, na_value=np.nan)
+            valid = ~np.isnan(scores)
+            self.cells[f"{col} Sum"] = np.bincount(
+                group_codes[valid], weights=scores[valid], minlength=len(self.cells)
+            )
+            self.cells[f"{col} Count"] = np.bincount(
+                group_codes[valid], minlength=len(self.cells)
+            )
+
+    def counts(self, group_columns):
+        """df.groupby(group_columns).size().reset_index(name="Counts")"""
+        return (
+            self.cells.groupby(group_columns, observed=True)["Counts"]
+            .sum()
+            .reset_index()
+        )
+
+    def mean(self, group_column, score_col):
+        """Mean score per group, widened like widen_scores(df[score_col])."""
+        totals = self.cells.groupby(group_column, observed=True)[
+            [f"{score_col} Sum", f"{score_col} Count"]
+        ].sum()
+        return (totals[f"{score_col} Sum"] / totals[f"{score_col} Count"]).rename(
+            score_col
+        )
+
+
+def top_counts(series, n=10):
+    """Most frequent values of series, CWE codes without information excluded."""
+    return series[~series.isin(NO_CWE)].value_counts().head(n)
 
 
 class ChartGenerator:
@@ -24,22 +110,27 @@ class ChartGenerator:
         "P1": "#F8696B",  # Red
     }
 
-    def __init__(self, df, old_dfs, path):
+    IMAGE_WIDTH = 700
+    IMAGE_HEIGHT = 500
+
+    def __init__(self, df, old_dfs, cache=None, renderer=None):
         """
-        Initialize the ChartGenerator with a DataFrame and output path.
+        Initialize the ChartGenerator with a DataFrame and a chart cache.
 
         :param df: pandas DataFrame containing the data
-        :param path: str, path to save the generated charts
+        :param cache: ChartCache storing the rendered charts, default is .chart_cache
+        :param renderer: Executor exporting the figures, see renderer_pool. The
+            figures are then exported in the background and wait must be called
+            before using the returned paths
         """
         self.df = df
         self.old_dfs = old_dfs
-        self.path = path
-        # create the output directory if it doesn't exist
-        if self.path:
-            try:
-                os.makedirs(self.path)
-            except FileExistsError:
-                pass
+        self.cache = cache if cache is not None else ChartCache()
+        self.renderer = renderer
+        self.pending = {}
+        self._cube = None
+        # Entries of the previous runs only, this run's charts are all kept
+        self.cache.evict()
 
     def _normalize(self, fig):
         """Normalize the layout of the figure."""
@@ -49,14 +140,42 @@ class ChartGenerator:
         )
 
     def _save_figure(self, fig, filename):
-        """Save the figure to the specified path and return the full path."""
-        full_path = f"{self.path}/{filename}" if self.path else filename
-        print(f"Saving figure to {full_path}")
-        try:
-            pio.write_image(fig, full_path)
-        except Exception as e:
-            print(f"Error saving figure: {e}")
-        return full_path
+        """Render the figure unless it is in the cache and return the path of its image."""
+        size = (self.IMAGE_WIDTH, self.IMAGE_HEIGHT)
+        entry_path, cached = self.cache.lookup(fig.to_json(), *size)
+        if cached or entry_path in self.pending:
+            print(f"Loaded figure {filename} from cache")
+            return entry_path
+        print(f"Saving figure {filename} to {entry_path}")
+        if self.renderer is not None:
+            self.pending[entry_path] = self.renderer.submit(
+                _render_figure, self.cache, fig.to_dict(), entry_path, *size
+            )
+            return entry_path
+        error = _render_figure(self.cache, fig, entry_path, *size)
+        if error:
+            print(f"Error saving figure: {error}")
+        return entry_path
+
+    def wait(self):
+        """Wait until every figure submitted to the renderer is exported."""
+        for future in self.pending.values():
+            error = future.result()
+            if error:
+                print(f"Error saving figure: {error}")
+        self.pending = {}
+
+    @staticmethod
+    def _plain(df):
+        """Plotly expands categoricals to every category, aggregates are plotted as objects."""
+        return df.astype({col: object for col in df.columns if is_categorical(df[col])})
+
+    @property
+    def cube(self):
+        """ChartCube of the scan, built by the first chart using it."""
+        if self._cube is None:
+            self._cube = ChartCube(self.df)
+        return self._cube
 
     def _has_required_columns(self, required_columns):
         """Check if the DataFrame has the required columns."""
@@ -70,12 +189,7 @@ class ChartGenerator:
             print(f"Missing required columns for CWE chart: {required_columns}")
             return None
 
-        cwe_df = self.df.copy()
-        replace_dict = {"NVD-CWE-noinfo": pd.NA, "NVD-CWE-Other": pd.NA}
-        cwe_df.replace(replace_dict, inplace=True)
-        cwe_df.dropna(subset=["CWE Code"], inplace=True)
-
-        cwe_counts = cwe_df["CWE Code"].value_counts().head(10)
+        cwe_counts = top_counts(self.df["CWE Code"])
         cwe_counts.index = cwe_counts.index + " (" + cwe_counts.values.astype(str) + ")"
         cwe_df = pd.DataFrame(
             {"CWE Code": cwe_counts.index, "Frequency": cwe_counts.values}
@@ -94,13 +208,7 @@ class ChartGenerator:
             print(f"Missing required columns for CAPEC chart: {required_columns}")
             return None
 
-        capec_df = self.df.copy()
-        capec_df.replace(
-            {"NVD-CWE-noinfo": pd.NA, "NVD-CWE-Other": pd.NA}, inplace=True
-        )
-        capec_df.dropna(subset=["Related CAPECs"], inplace=True)
-
-        capec_counts = capec_df["Related CAPECs"].value_counts().head(10)
+        capec_counts = top_counts(self.df["Related CAPECs"])
         capec_counts.index = (
             capec_counts.index.str.split(" / ").str[0]
             + " ("
@@ -130,7 +238,7 @@ class ChartGenerator:
             )
             return None
 
-        domain_counts = self.df.groupby(group_columns).size().reset_index(name="Counts")
+        domain_counts = self._plain(self.cube.counts(group_columns))
 
         fig = px.sunburst(
             domain_counts,
@@ -154,11 +262,9 @@ class ChartGenerator:
             )
             return None
 
-        scores = (
-            self.df.groupby(group_column)[score_col].mean().sort_values(ascending=False)
-        )
-        scores_df = pd.DataFrame(
-            {group_column: scores.index, "Average Score": scores.values}
+        scores = self.cube.mean(group_column, score_col).sort_values(ascending=False)
+        scores_df = self._plain(
+            pd.DataFrame({group_column: scores.index, "Average Score": scores.values})
         )
 
         fig = px.bar(
@@ -181,11 +287,7 @@ class ChartGenerator:
             )
             return None
 
-        criticity_counts = (
-            self.df.groupby([group_column, "Criticity"])
-            .size()
-            .reset_index(name="Counts")
-        )
+        criticity_counts = self._plain(self.cube.counts([group_column, "Criticity"]))
         criticity_counts["Criticity"] = pd.Categorical(
             criticity_counts["Criticity"], categories=self.CRITICITY_ORDER, ordered=True
         )
@@ -219,11 +321,7 @@ class ChartGenerator:
             )
             return None
 
-        priority_counts = (
-            self.df.groupby([group_column, "Priority"])
-            .size()
-            .reset_index(name="Counts")
-        )
+        priority_counts = self._plain(self.cube.counts([group_column, "Priority"]))
         priority_counts["Priority"] = pd.Categorical(
             priority_counts["Priority"],
             categories=list(self.PRIORITY_COLORS.keys()),
@@ -262,7 +360,6 @@ class ChartGenerator:
             self.df.groupby("Published Date").size().reset_index(name="Number of CVEs")
         )
         cve_by_date_df = pd.DataFrame(cve_by_date)
-        cve_by_date_df = cve_by_date_df[cve_by_date_df["Published Date"] != "Unknown"]
         # Group by year-mm to simplify the chart
         # cve_by_date_df["Published Date"] = (
         #     cve_by_date_df["Published Date"].astype(str).str.split("-").str[0]
@@ -282,13 +379,7 @@ class ChartGenerator:
         #     title="Number of CVEs by Date",
         # )
 
-        cve_by_date_df["Published Date"] = pd.to_datetime(
-            cve_by_date_df["Published Date"]
-        )
-
-        # Trier les données par date
-        cve_by_date_df = cve_by_date_df.sort_values("Published Date")
-
+        # Missing dates are not grouped, and the groups are sorted by date
         # Calculer la somme cumulative des CVEs
         cve_by_date_df["Cumulative CVEs"] = cve_by_date_df["Number of CVEs"].cumsum()
 
@@ -311,8 +402,7 @@ class ChartGenerator:
     # The title is "Number of CVEs by Priority in each Scan"
     # Add value on the line
     def generate_cve_by_scan_chart(self):
-        every_df = [self.df] + self.old_dfs.copy()
-        every_df = every_df[::-1]
+        every_df = [self.df, *self.old_dfs][::-1]
         data = []
         charts_colors = self.PRIORITY_COLORS.copy()
         charts_colors["Total"] = "#000000"
@@ -354,12 +444,11 @@ class ChartGenerator:
     # with every df in old_dfs, we can generate a chart with the mean of the cvss computed score for each scan
     # the x-axis is the df index and the y-axis is the mean of the cvss computed score
     def generate_mean_cvss_by_scan_chart(self, score_col="CVSS Computed Score"):
-        every_df = [self.df] + self.old_dfs.copy()
-        every_df = every_df[::-1]
+        every_df = [self.df, *self.old_dfs][::-1]
         data = []
         for i, df in enumerate(every_df):
             # round the mean to 2 decimals
-            mean_cvss = df[score_col].mean()
+            mean_cvss = widen_scores(df[score_col]).mean()
             mean_cvss = round(mean_cvss, 2)
             data.append({"Scan": f"Scan {1+i-len(every_df)}", "Mean CVSS": mean_cvss})
         data = pd.DataFrame(data)
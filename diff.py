@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+from schema import concat_frames, is_categorical, widen_scores
+
+# Columns identifying a vulnerability in two scans
+KEY_COLUMNS = ["Server", "CVE Code", "Component"]
+
+UPDATE_COLUMNS = ["Update Cisa", "Update EPSS", "Update CVSS", "Update Maturity"]
+
+MATURITY_LEVELS = {
+    "high": 3,
+    "functional": 2,
+    "proof-of-concept": 1,
+    "unproven": 0,
+}
+
+# Scores closer than this are equal, widened scores have 6 decimals
+FLOAT_TOLERANCE = 1e-9
+
+
+def key_codes(column, old_column):
+    """
+    Codes of the values of column, the codes of the same values in old_column, -1
+    for the values absent from column, and the number of codes. Missing values
+    match each other, like in a merge.
+    """
+    if is_categorical(column) and is_categorical(old_column):
+        categories = column.cat.categories
+        codes = column.cat.codes.to_numpy(dtype=np.int64)
+        codes[codes < 0] = len(categories)
+        old_codes = categories.get_indexer(old_column.cat.categories)
+        old_codes = np.append(old_codes, len(categories))[old_column.cat.codes]
+        return codes, old_codes.astype(np.int64), len(categories) + 1
+    codes, uniques = pd.factorize(column, use_na_sentinel=False)
+    old_codes = pd.Index(uniques).get_indexer(old_column)
+    return codes.astype(np.int64), old_codes.astype(np.int64), len(uniques)
+
+
+def match_rows(dataframe, old_df, keys=KEY_COLUMNS):
+    """
+    Position in old_df of the row with the same keys as every row of dataframe, -1
+    when there is none. The composite key is built from the codes of every key
+    column, so only the key columns are read. When old_df has several rows with the
+    same keys, the first one is used.
+    """
+    codes = np.zeros(len(dataframe), dtype=np.int64)
+    old_codes = np.zeros(len(old_df), dtype=np.int64)
+    for col in keys:
+        column_codes, old_column_codes, n_codes = key_codes(dataframe[col], old_df[col])
+        absent = (old_codes < 0) | (old_column_codes < 0)
+        # Densify the combined key so that it never overflows
+        codes, uniques = pd.factorize(codes * n_codes + column_codes)
+        old_codes = pd.Index(uniques).get_indexer(
+            old_codes * n_codes + old_column_codes
+        )
+        old_codes[absent] = -1
+    present = np.flatnonzero(old_codes >= 0)
+    first_keys, first_rows = np.unique(old_codes[present], return_index=True)
+    duplicates = len(present) - len(first_keys)
+    if duplicates:
+        print(f"{duplicates} duplicated rows in the old scan, the first ones are used")
+    positions = np.full(len(uniques), -1, dtype=np.int64)
+    positions[first_keys] = present[first_rows]
+    return positions[codes]
+
+
+def changed(values, old_values):
+    """values != old_values, missing values being equal to each other."""
+    if pd.api.types.is_float_dtype(values) and pd.api.types.is_float_dtype(old_values):
+        return ~np.isclose(
+            widen_scores(values).to_numpy(dtype=np.float64, na_value=np.nan),
+            widen_scores(old_values).to_numpy(dtype=np.float64, na_value=np.nan),
+            rtol=0,
+            atol=FLOAT_TOLERANCE,
+            equal_nan=True,
+        )
+    values, old_values = values.astype(object), old_values.astype(object)
+    both_missing = values.isna().to_numpy() & old_values.isna().to_numpy()
+    return ~((values == old_values).to_numpy(dtype=bool) | both_missing)
+
+
+def diff_scans(dataframe, old_df, score_col, keys=KEY_COLUMNS):
+    """
+    Status of every row of dataframe against the previous scan old_df, "New",
+    "Known" or "Updated", and the Update columns describing the changes of the
+    Cisa reference, EPSS, score and maturity. Only the key and compared columns of
+    both scans are read.
+
+    :return: pd.DataFrame with the Status and UPDATE_COLUMNS, indexed like dataframe
+    """
+    positions = match_rows(dataframe, old_df, keys)
+    matched = positions >= 0
+    rows = np.flatnonzero(matched)
+
+    def current(col):
+        return dataframe[col].iloc[rows].reset_index(drop=True)
+
+    def previous(col):
+        return old_df[col].iloc[positions[rows]].reset_index(drop=True)
+
+    updates = {col: np.full(len(rows), "", dtype=object) for col in UPDATE_COLUMNS}
+    updated = np.zeros(len(rows), dtype=bool)
+    compared = ["Cisa Reference", "Maturity", "Score EPSS", score_col]
+    for col in [col for col in compared if col in dataframe and col in old_df]:
+        values, old_values = current(col), previous(col)
+        is_changed = changed(values, old_values)
+        updated |= is_changed
+        if col == "Cisa Reference":
+            update = values.astype(object).map({"Yes": "Added", "No": "Removed"})
+            updates["Update Cisa"][is_changed] = update.to_numpy()[is_changed]
+        elif col == "Maturity":
+            values, old_values = values.astype(object), old_values.astype(object)
+            is_changed = changed(
+                values.map(MATURITY_LEVELS).astype("float64"),
+                old_values.map(MATURITY_LEVELS).astype("float64"),
+            )
+            update = old_values + " -> " + values
+            updates["Update Maturity"][is_changed] = update.to_numpy()[is_changed]
+        else:
+            update = widen_scores(values) - widen_scores(old_values)
+            update_col = "Update EPSS" if col == "Score EPSS" else "Update CVSS"
+            updates[update_col][is_changed] = update.to_numpy()[is_changed]
+
+    result = pd.DataFrame(
+        {"Status": "New", **{col: np.nan for col in UPDATE_COLUMNS}},
+        index=range(len(dataframe)),
+    ).astype(object)
+    status = np.where(updated, "Updated", "Known")
+    result.iloc[rows, 0] = status
+    for i, col in enumerate(UPDATE_COLUMNS, start=1):
+        result.iloc[rows, i] = updates[col]
+    result.index = dataframe.index
+    return result
+
+
+def latest_rows(scans, keys, columns=None):
+    """
+    Newest row of every key of the scans, given from the newest to the oldest. Rows
+    kept from an older scan are vulnerabilities absent from the newest one, their
+    Status is "Fixed".
+
+    :param columns: columns of the rows to keep, default is every column
+
+    The scans are walked once with the hashes of the keys already seen, so only the
+    kept rows are copied and the memory is bounded by the number of distinct keys.
+    """
+    seen = np.empty(0, dtype=np.uint64)
+    rows = []
+    for i, scan in enumerate(scans):
+        hashes = pd.util.hash_pandas_object(scan[keys], index=False).to_numpy()
+        first = ~pd.Index(hashes).isin(seen) & ~pd.Index(hashes).duplicated()
+        if columns is None:
+            kept = scan[first]
+        else:
+            kept = scan.loc[first, [col for col in scan.columns if col in columns]]
+        if i > 0:
+            kept = kept.assign(Status="Fixed")
+        rows.append(kept)
+        seen = np.concatenate([seen, hashes[first]])
+    return concat_frames(rows)
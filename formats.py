@@ -0,0 +1,135 @@
+from openpyxl.formatting.rule import CellIsRule, ColorScaleRule
+from openpyxl.styles import Font, PatternFill
+from openpyxl.utils import get_column_letter
+from schema import DATE_COLUMNS, widen_frame
+
+# Column widths are computed from the header and the first rows
+WIDTH_PREVIEW_ROWS = 48
+
+# Written in place of the missing dates
+UNKNOWN_DATE = "Unknown"
+
+
+class ColumnFormat:
+    """
+    Formats of a sheet column: conditional rules applied to the whole column range,
+    number format of its values and width.
+    """
+
+    def __init__(self, rules=None, number_format=None, width=None):
+        self.rules = rules or []
+        self.number_format = number_format
+        self.width = width
+
+
+def fill_rules(criteria_colors):
+    """Fill the cells equal to a criterion with its color."""
+    return [
+        CellIsRule(
+            operator="equal",
+            formula=[f'"{criterion}"'],
+            stopIfTrue=True,
+            fill=PatternFill(start_color=color, end_color=color, fill_type="solid"),
+        )
+        for criterion, color in criteria_colors.items()
+    ]
+
+
+def color_scale_rules(start_value, mid_value, end_value, colors):
+    return [
+        ColorScaleRule(
+            start_type="percent",
+            start_value=start_value,
+            start_color=colors["min"],
+            mid_type="num",
+            mid_value=mid_value,
+            mid_color=colors["mid"],
+            end_type="percent",
+            end_value=end_value,
+            end_color=colors["max"],
+        )
+    ]
+
+
+def sign_rules(positive_color, negative_color):
+    """Color the font of the positive and negative values."""
+    return [
+        CellIsRule(
+            operator="greaterThan",
+            formula=[0],
+            stopIfTrue=True,
+            font=Font(color=positive_color),
+        ),
+        CellIsRule(
+            operator="lessThan",
+            formula=[0],
+            stopIfTrue=True,
+            font=Font(color=negative_color),
+        ),
+    ]
+
+
+def apply_column_formats(ws, df, formats, max_row):
+    """
+    Compile the formats of the columns of df in ws: one conditional format range per
+    column on the rows 2 to max_row, and the column widths. Cells are never accessed,
+    so ws may be a write-only sheet with no row written yet.
+    """
+    for col, column_format in formats.items():
+        col_letter = get_column_letter(df.columns.get_loc(col) + 1)
+        for rule in column_format.rules:
+            ws.conditional_formatting.add(f"{col_letter}2:{col_letter}{max_row}", rule)
+        if column_format.width is not None:
+            ws.column_dimensions[col_letter].width = column_format.width
+
+
+def column_widths(df, rows=WIDTH_PREVIEW_ROWS):
+    """Width of every column of df, from its header and its first rows."""
+    preview = excel_frame(df.head(rows))
+    widths = {}
+    for col in df.columns:
+        values = [col] + excel_values(preview[col])
+        widths[col] = column_width(
+            col, max(len(readback_str(value)) for value in values)
+        )
+    return widths
+
+
+def column_width(col, max_length, max_width=25):
+    """Width of a column from the length of its longest value."""
+    if col.startswith("Description"):
+        return max_length + 5
+    return min(max_length, max_width) + 5
+
+
+def excel_frame(df):
+    """
+    Shallow copy of df as written in a sheet: scores widened back to float64 and
+    missing dates written "Unknown".
+    """
+    df = widen_frame(df)
+    missing = [col for col in DATE_COLUMNS if col in df.columns and df[col].hasnans]
+    if missing:
+        df = df.copy(deep=False)
+        for col in missing:
+            df[col] = df[col].astype(object).where(df[col].notna(), UNKNOWN_DATE)
+    return df
+
+
+def excel_values(series):
+    """Values of series as written by pandas in a sheet, missing values being None."""
+    values = series.astype(object)
+    return values.where(series.notna(), None).tolist()
+
+
+def readback_str(value):
+    """str of a value as it is read back from a sheet, used to size the columns."""
+    if value is None or (isinstance(value, str) and value == ""):
+        return "None"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # Numbers are written with 16 significant digits, integers read back as int
+        text = "%.16g" % value
+        if "." in text or "e" in text:
+            return str(float(text))
+        return str(int(text))
+    return str(value)
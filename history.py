@@ -0,0 +1,94 @@
+import json
+import os
+import pandas as pd
+from cache import file_hash
+from schema import DATE_COLUMNS, parse_dates
+
+
+class ScanHistory:
+    """
+    Persistent store of the computed CVE scans.
+
+    Every scan is added once, with the Priority, Status and Update columns computed
+    against its predecessor, so a new report only has to diff the newest scan
+    against the last stored one instead of recomputing the whole history chain.
+    Frames are pickled: the Update columns mix strings and floats, which Parquet
+    cannot store.
+    """
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, path=".report_history", depth=None):
+        """
+        :param path: str, directory of the store
+        :param depth: int, number of stored scans used as old scans, default is all
+        """
+        self.path = path
+        self.depth = depth or None
+        os.makedirs(self.path, exist_ok=True)
+        self.entries = self._read_manifest()
+
+    def _read_manifest(self):
+        manifest_path = os.path.join(self.path, self.MANIFEST)
+        if not os.path.exists(manifest_path):
+            return []
+        with open(manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_manifest(self):
+        manifest_path = os.path.join(self.path, self.MANIFEST)
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    @staticmethod
+    def key(df, date_format):
+        """Key of a scan, the hash of the csv it has been read from."""
+        if "history_key" not in df.attrs:
+            df.attrs["history_key"] = file_hash(df.attrs["source"], salt=date_format)
+        return df.attrs["history_key"]
+
+    def __contains__(self, key):
+        return any(entry["key"] == key for entry in self.entries)
+
+    def scans(self, exclude=()):
+        """Stored scans from the newest to the oldest, without the excluded keys."""
+        entries = [entry for entry in self.entries if entry["key"] not in exclude]
+        entries = entries[::-1][: self.depth]
+        scans = []
+        for entry in entries:
+            print(f"Loading scan {entry['label']} from history")
+            df = pd.read_pickle(os.path.join(self.path, entry["file"]))
+            # Scans stored by older versions hold "Unknown" instead of missing dates
+            for col in [col for col in DATE_COLUMNS if col in df.columns]:
+                df[col] = parse_dates(df[col], df.attrs.get("date_format"))
+            scans.append(df)
+        return scans
+
+    def previous_scans(self, dataframe, old_cve_dfs, date_format):
+        """
+        Old scans of dataframe: the given ones, taken as the most recent, followed by
+        the stored ones.
+        """
+        given = [self.key(df, date_format) for df in [dataframe] + old_cve_dfs]
+        return old_cve_dfs + self.scans(exclude=given)
+
+    def record(self, dataframe, old_cve_dfs, date_format, label=""):
+        """Store the computed scans which are not stored yet, from the oldest one."""
+        for df in old_cve_dfs[::-1]:
+            self.add(
+                self.key(df, date_format), df, os.path.basename(df.attrs["source"])
+            )
+        self.add(self.key(dataframe, date_format), dataframe, label)
+
+    def add(self, key, df, label=""):
+        """Store a computed scan, newer than every scan already stored."""
+        if key in self:
+            return
+        filename = f"{key}.pkl"
+        df.to_pickle(os.path.join(self.path, filename))
+        self.entries.append(
+            {"key": key, "file": filename, "label": label, "rows": len(df)}
+        )
+        self._write_manifest()
+        print(f"Scan {label or key} added to history")
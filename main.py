@@ -1,6 +1,12 @@
 import sys
+import profiling
 from report import ReportGenerator
 from utils import get_df, get_df_interactive, Args
+from cache import ChartCache, ScanCache
+from history import ScanHistory
+from priority import PriorityRules
+from watch import ScanWatcher
+from batch import load_manifest, run_batch
 
 if __name__ == "__main__":
     args = sys.argv[1:]
@@ -11,18 +17,143 @@ if __name__ == "__main__":
         "-format": Args(
             "%Y-%m-%d", True, "Date format inside the csv, default is %Y-%m-%d"
         ),
-        "-cve": Args("", True, "Path to the CVE csv input"),
+        "-cve": Args(
+            "",
+            True,
+            "Path to the CVE csv input, .csv.gz and .csv.zst included, - for stdin",
+        ),
         "-cpe": Args("", True, "Path to the CPE csv input"),
         "-patch": Args("", True, "Path to the Patch csv input"),
         "-issue": Args("", True, "Path to the Security Issue csv input"),
         "-olds": Args([], True, "Path to the olds CVE csv input, separated by ','"),
+        "-cache": Args(
+            ".report_cache",
+            True,
+            "Directory of the parsed csv cache, default is .report_cache",
+        ),
+        "-cache-size": Args(
+            2048, True, "Maximum size of the cache in MB, default is 2048"
+        ),
+        "-cache-age": Args(
+            30, True, "Days after which an unused cache entry is removed, default is 30"
+        ),
+        "-chunksize": Args(
+            0, True, "Read the csv by chunks of this number of rows to bound memory"
+        ),
+        "-drop-verbose": Args(
+            False, False, "Do not load the Content and Vector columns of the csv"
+        ),
+        "-jobs": Args(
+            0, True, "Maximum number of csv read at once, default is one per cpu"
+        ),
+        "-history": Args(
+            "",
+            True,
+            "Directory of the computed scans history, replaces -olds once filled",
+        ),
+        "-history-depth": Args(
+            0, True, "Number of stored scans used as old scans, default is all"
+        ),
+        "-stream": Args(
+            False, False, "Write the workbooks in a single pass, with less memory"
+        ),
+        "-low-memory": Args(
+            False,
+            False,
+            "Store the computed columns as categoricals and project the synthesis",
+        ),
+        "-priority-rules": Args(
+            "",
+            True,
+            "Json file of the rules computing the Priority, see priority.py",
+        ),
+        "-batch": Args(
+            "",
+            True,
+            "Json or toml manifest of the reports to generate, see batch.py",
+        ),
+        "-batch-jobs": Args(
+            0,
+            True,
+            "Number of processes generating the -batch reports, default is none",
+        ),
+        "-sheets": Args(
+            "",
+            True,
+            "Sheets of the report separated by ',', patterns like 'old n*' allowed",
+        ),
+        "-exclude-sheets": Args(
+            "", True, "Sheets left out of the report separated by ',', like Data"
+        ),
+        "-charts": Args(
+            "",
+            True,
+            "Charts of the report separated by ',': "
+            + ", ".join(name for name, _, _ in ReportGenerator.CHARTS),
+        ),
+        "-exclude-charts": Args(
+            "", True, "Charts left out of the report separated by ','"
+        ),
+        "-split": Args(
+            "",
+            True,
+            "Column of the scans, generate a report by value of it, like Domain",
+        ),
+        "-split-jobs": Args(
+            0, True, "Number of processes writing the -split reports, default is none"
+        ),
+        "-watch": Args(
+            "",
+            True,
+            "Directory of the scans, build the report of every new scan dropped in it",
+        ),
+        "-watch-interval": Args(
+            30, True, "Seconds between two checks of the -watch directory"
+        ),
+        "-watch-window": Args(
+            3, True, "Number of old scans kept in memory by -watch, default is 3"
+        ),
+        "-compute-jobs": Args(
+            0, True, "Number of processes computing the old scans, default is none"
+        ),
+        "-chart-cache": Args(
+            ".chart_cache",
+            True,
+            "Directory of the rendered charts cache, default is .chart_cache",
+        ),
+        "-chart-cache-size": Args(
+            256, True, "Maximum size of the charts cache in MB, default is 256"
+        ),
+        "-render-jobs": Args(
+            0, True, "Number of processes exporting the charts, default is none"
+        ),
+        "-shard-rows": Args(
+            0,
+            True,
+            "Split the sheets longer than this number of rows, default is the Excel limit",
+        ),
+        "-shard-workbooks": Args(
+            False, False, "Write the following shards in companion workbooks"
+        ),
+        "-no-cache": Args(False, False, "Parse every csv without using the cache"),
+        "-purge-cache": Args(False, False, "Empty the cache before running"),
+        "-profile": Args(
+            "",
+            True,
+            "Write the time, CPU time, peak memory and rows of every stage to this json",
+        ),
+        "-profile-cprofile": Args(
+            False, False, "With -profile, also dump the cProfile of the slowest stage"
+        ),
     }
     if "-h" in args or "--help" in args:
         print("Usage:")
         for param, arg in params.items():
             print(f"{param}: {arg.help}")
         exit(0)
-    for i in range(len(args)):
+    # The values are skipped, so "-" (stdin) is not taken for a param
+    i = 0
+    while i < len(args):
         if args[i] in params:
             if params[args[i]].need_value:
                 if not len(args) > i + 1:
@@ -34,19 +165,28 @@ if __name__ == "__main__":
                 params[args[i]].set(True)
         elif args[i].startswith("-"):
             print(f"param {args[i]} unknown")
+        i += 1
+
+    profiler = None
+    if params["-profile"].value:
+        profiler = profiling.start(cprofile=params["-profile-cprofile"].value)
 
-    data_df, cpe_df, patch_df, issue_df, old_cve_dfs = (
-        get_df_interactive()
-        if params["-i"].value
-        else get_df(
-            params["-cve"].value,
-            params["-cpe"].value,
-            params["-patch"].value,
-            params["-issue"].value,
-            params["-olds"].value,
+    cache = None
+    if not params["-no-cache"].value:
+        cache = ScanCache(
+            params["-cache"].value,
+            max_size_mb=float(params["-cache-size"].value),
+            max_age_days=float(params["-cache-age"].value),
         )
-    )
+        if params["-purge-cache"].value:
+            cache.purge()
 
+    read_options = {
+        "cache": cache,
+        "date_format": params["-format"].value,
+        "chunksize": int(params["-chunksize"].value),
+        "drop_verbose": params["-drop-verbose"].value,
+    }
     # Group by CVE: a line by CVE, affecting multiple servers and multiple components
     # Ex: CVE-2020-1234, Server1 | server2, Component1 | Component2,
     # Group by CVE Code and Server: a line by CVE and by server, but multiple components
@@ -57,21 +197,96 @@ if __name__ == "__main__":
     #     CVE-2020-1234, Server1, Component2,
     #     CVE-2020-1234, Server2, Component1,
     #     CVE-2020-1234, Server2, Component2,
+    generator_options = {
+        "score_col": "CVSS Computed Score",
+        "groupby": ["CVE Code"],
+        # "groupby": ["CVE Code", "Server"],
+        "date_format": params["-format"].value,
+        "stream": params["-stream"].value,
+        "render_jobs": int(params["-render-jobs"].value),
+        "compute_jobs": int(params["-compute-jobs"].value),
+        "chart_cache": ChartCache(
+            params["-chart-cache"].value,
+            max_size_mb=float(params["-chart-cache-size"].value),
+        ),
+        "shard_rows": int(params["-shard-rows"].value),
+        "shard_workbooks": params["-shard-workbooks"].value,
+        "low_memory": params["-low-memory"].value,
+        "split_by": params["-split"].value or None,
+        **{
+            option: params[param].value.split(",") if params[param].value else None
+            for option, param in [
+                ("sheets", "-sheets"),
+                ("exclude_sheets", "-exclude-sheets"),
+                ("charts", "-charts"),
+                ("exclude_charts", "-exclude-charts"),
+            ]
+        },
+        "split_jobs": int(params["-split-jobs"].value),
+        "priority_rules": (
+            PriorityRules.load(params["-priority-rules"].value)
+            if params["-priority-rules"].value
+            else None
+        ),
+    }
+
+    if params["-batch"].value:
+        with profiling.stage("batch"):
+            results = run_batch(
+                load_manifest(params["-batch"].value),
+                read_options,
+                generator_options,
+                workers=int(params["-batch-jobs"].value),
+            )
+        if profiler is not None:
+            profiler.write(params["-profile"].value)
+        exit(1 if any(result["error"] for result in results) else 0)
+
+    if params["-watch"].value:
+        ScanWatcher(
+            params["-watch"].value,
+            params["-name"].value,
+            read_options,
+            generator_options,
+            window=int(params["-watch-window"].value),
+            interval=float(params["-watch-interval"].value),
+        ).run()
+        if profiler is not None:
+            profiler.write(params["-profile"].value)
+        exit(0)
+
+    with profiling.stage("get_df") as record:
+        data_df, cpe_df, patch_df, issue_df, old_cve_dfs = (
+            get_df_interactive(**read_options)
+            if params["-i"].value
+            else get_df(
+                params["-cve"].value,
+                params["-cpe"].value,
+                params["-patch"].value,
+                params["-issue"].value,
+                params["-olds"].value,
+                jobs=int(params["-jobs"].value),
+                **read_options,
+            )
+        )
+        record["rows"] = len(data_df) + sum(len(df) for df in old_cve_dfs)
+
+    history = None
+    if params["-history"].value:
+        history = ScanHistory(
+            params["-history"].value, depth=int(params["-history-depth"].value)
+        )
+        old_cve_dfs = history.previous_scans(
+            data_df, old_cve_dfs, params["-format"].value
+        )
+
     generator = ReportGenerator(
-        data_df,
-        cpe_df,
-        patch_df,
-        issue_df,
-        old_cve_dfs,
-        score_col="CVSS Computed Score",
-        groupby=["CVE Code"],
-        # groupby=["CVE Code", "Server"],
-        date_format=params["-format"].value,
-    )
-    generator.generate_report(f"AUDIT_{params['-name'].value}", params["-date"].value)
-    generator.generate_synthesis(
-        f"AUDIT_SYNTHESIS_{params['-name'].value}",
-        params["-date"].value,
-        subset=["Server", "CVE Code", "Product"],
-        groupby=["CVE Code", "Server", "Status"],
+        data_df, cpe_df, patch_df, issue_df, old_cve_dfs, **generator_options
     )
+    if history is not None:
+        history.record(
+            data_df, old_cve_dfs, params["-format"].value, label=params["-date"].value
+        )
+    generator.generate_reports(params["-name"].value, params["-date"].value)
+    if profiler is not None:
+        profiler.write(params["-profile"].value)
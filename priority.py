@@ -0,0 +1,109 @@
+import json
+import operator
+import numpy as np
+import pandas as pd
+from schema import is_categorical
+
+# Rules of the report: every vulnerability starts at P6, each escalation matching
+# raises it one level plus one for the first one, and when none matches each minor
+# rule matching raises it one level.
+DEFAULT_PRIORITY_RULES = {
+    "lowest": 6,
+    "minor": [
+        {"column": "{score}", "op": ">=", "value": 7},
+    ],
+    "escalations": [
+        {"column": "Cisa Reference", "op": "==", "value": "Yes"},
+        {"column": "Maturity", "op": "==", "value": "high"},
+        {"column": "Score EPSS", "op": ">=", "value": 0.8},
+        {"column": "{score}", "op": ">=", "value": 9},
+    ],
+}
+
+OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">=": operator.ge,
+    ">": operator.gt,
+    "<=": operator.le,
+    "<": operator.lt,
+    "in": lambda values, value: values.isin(value),
+}
+
+
+class PriorityRules:
+    """
+    Priority of the vulnerabilities, from P1 to P{lowest}, declared as data:
+
+    - lowest: level of a vulnerability matching no rule
+    - minor: conditions raising the priority one level each, when no escalation
+      matches
+    - escalations: conditions raising the priority one level each, plus one level
+      as soon as one matches
+
+    A condition is {"column": ..., "op": ..., "value": ...}, op being one of
+    OPERATORS, and "{score}" standing for the score column of the report.
+    Conditions are evaluated on the whole columns at once, on the categories only
+    for the categorical columns.
+    """
+
+    def __init__(self, rules=DEFAULT_PRIORITY_RULES):
+        self.lowest = int(rules.get("lowest", 6))
+        self.minor = list(rules.get("minor", []))
+        self.escalations = list(rules.get("escalations", []))
+        if self.lowest < 1:
+            raise ValueError(f"The lowest priority must be at least 1: {self.lowest}")
+        for condition in self.minor + self.escalations:
+            if condition.get("op") not in OPERATORS:
+                raise ValueError(
+                    f"Unknown operator in priority rule {condition}, "
+                    f"expected one of {list(OPERATORS)}"
+                )
+
+    @classmethod
+    def load(cls, path):
+        """Rules of a json file, with the keys of DEFAULT_PRIORITY_RULES."""
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @property
+    def levels(self):
+        return [f"P{level}" for level in range(1, self.lowest + 1)]
+
+    def columns(self, score_col):
+        """Columns read by the rules."""
+        conditions = self.minor + self.escalations
+        return list(
+            dict.fromkeys(
+                condition["column"].format(score=score_col) for condition in conditions
+            )
+        )
+
+    @staticmethod
+    def _match(column, condition):
+        """Boolean array of the values of column matching the condition."""
+        compare = OPERATORS[condition["op"]]
+        if is_categorical(column):
+            matches = np.asarray(compare(column.cat.categories, condition["value"]))
+            # Missing values, coded -1, match nothing
+            matches = np.append(matches.astype(bool), False)
+            return matches[column.cat.codes.to_numpy()]
+        return compare(column, condition["value"]).to_numpy(dtype=bool, na_value=False)
+
+    def evaluate(self, dataframe, score_col):
+        """
+        Priority of every row of dataframe.
+
+        :return: categorical pd.Series of P1 to P{lowest}, indexed like dataframe
+        """
+        conditions = self.minor + self.escalations
+        matches = np.zeros((len(conditions), len(dataframe)), dtype=bool)
+        for i, condition in enumerate(conditions):
+            column = dataframe[condition["column"].format(score=score_col)]
+            matches[i] = self._match(column, condition)
+        minor = np.count_nonzero(matches[: len(self.minor)], axis=0)
+        escalations = np.count_nonzero(matches[len(self.minor) :], axis=0)
+        raised = np.where(escalations > 0, escalations + 1, minor)
+        levels = np.clip(self.lowest - raised, 1, self.lowest)
+        priority = pd.Categorical.from_codes(levels - 1, categories=self.levels)
+        return pd.Series(priority, index=dataframe.index, name="Priority")
@@ -0,0 +1,152 @@
+import cProfile
+import json
+import resource
+import time
+from contextlib import contextmanager, nullcontext
+
+# Profiler of the run, set by start
+_profiler = None
+
+# Linux files resetting and reading the peak resident memory of the process
+CLEAR_REFS_PATH = "/proc/self/clear_refs"
+STATUS_PATH = "/proc/self/status"
+
+
+class Profiler:
+    """
+    Wall time, CPU time, peak RSS and row count of the stages of a run. Stages nest,
+    a stage is named after the stages it runs in: "generate_report/save".
+
+    The peak RSS of a stage is the one reached while it ran, its nested stages
+    included, the peak of the process being reset when a stage starts, and the
+    memory the stage took is its peak minus its start RSS. Where the peak cannot be
+    reset (not Linux), it is the peak of the process so far, without start RSS.
+    Profiling resets the high-water mark of the process, VmHWM and ru_maxrss, so the
+    peak of the run is the maximum of the peaks read by the profiler. The CPU time
+    includes the one of the pool workers the stage waited for, also recorded alone
+    as workers_cpu_s, while their memory is not counted.
+
+    With cprofile, every top-level stage runs under cProfile and the profile of the
+    slowest one is kept, to be dumped as a .prof file (snakeviz, flameprof, ...).
+    """
+
+    def __init__(self, cprofile=False):
+        self.cprofile = cprofile
+        self.records = []
+        self.names = []
+        self.slowest = None
+        self.start_time = time.perf_counter()
+        # Peak RSS of the running stages, from the outermost one, and of the run
+        self.peaks = []
+        self.max_peak = peak_rss_mb()
+        self.resettable = reset_peak_rss()
+
+    def update_peaks(self):
+        """Fold the peak RSS since the last reset into the running stages."""
+        peak = stage_peak_rss_mb() if self.resettable else peak_rss_mb()
+        self.peaks = [max(stage_peak, peak) for stage_peak in self.peaks]
+        self.max_peak = max(self.max_peak, peak)
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """
+        Record the stage run in the with block. The yielded dict is the record, rows
+        may be set in it once known.
+        """
+        self.names.append(name)
+        record = {"stage": "/".join(self.names), "rows": rows}
+        profile = None
+        if self.cprofile and len(self.names) == 1:
+            profile = cProfile.Profile()
+            profile.enable()
+        self.update_peaks()
+        self.peaks.append(0)
+        if self.resettable:
+            reset_peak_rss()
+            record["start_rss_mb"] = round(status_mb("VmRSS"), 1)
+        wall, cpu, workers_cpu = (
+            time.perf_counter(),
+            time.process_time(),
+            workers_cpu_s(),
+        )
+        try:
+            yield record
+        finally:
+            record["wall_s"] = round(time.perf_counter() - wall, 3)
+            workers_cpu = workers_cpu_s() - workers_cpu
+            record["cpu_s"] = round(time.process_time() - cpu + workers_cpu, 3)
+            record["workers_cpu_s"] = round(workers_cpu, 3)
+            self.update_peaks()
+            record["peak_rss_mb"] = round(self.peaks.pop(), 1)
+            self.names.pop()
+            self.records.append(record)
+            if profile is not None:
+                profile.disable()
+                if self.slowest is None or record["wall_s"] > self.slowest[0]:
+                    self.slowest = (record["wall_s"], record["stage"], profile)
+
+    def write(self, path):
+        """Write the records to path as json, and the slowest profile to path.prof."""
+        self.update_peaks()
+        report = {
+            "total_wall_s": round(time.perf_counter() - self.start_time, 3),
+            "peak_rss_mb": round(self.max_peak, 1),
+            "stages": self.records,
+        }
+        if self.slowest is not None:
+            _, stage, profile = self.slowest
+            profile.dump_stats(path + ".prof")
+            report["profiled_stage"] = stage
+            report["profile"] = path + ".prof"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Profile written to {path}")
+
+
+def peak_rss_mb():
+    """Peak resident memory of the process in MB, ru_maxrss is in KB on Linux."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def reset_peak_rss():
+    """Reset the peak resident memory of the process, False when it cannot be."""
+    try:
+        with open(CLEAR_REFS_PATH, "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def status_mb(key):
+    """Memory field of the process status in MB, VmHWM and VmRSS being in kB."""
+    with open(STATUS_PATH) as f:
+        for line in f:
+            if line.startswith(f"{key}:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+def stage_peak_rss_mb():
+    """Peak resident memory since the last reset_peak_rss in MB."""
+    return status_mb("VmHWM") or peak_rss_mb()
+
+
+def workers_cpu_s():
+    """CPU time of the child processes waited for, the workers of the pools."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def start(cprofile=False):
+    """Profile the stages of the run from now on."""
+    global _profiler
+    _profiler = Profiler(cprofile)
+    return _profiler
+
+
+def stage(name, rows=None):
+    """Profiler.stage of the run, or a no-op when the run is not profiled."""
+    if _profiler is None:
+        return nullcontext({})
+    return _profiler.stage(name, rows)
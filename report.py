@@ -1,20 +1,47 @@
-from openpyxl import load_workbook
-from openpyxl.styles import Font, PatternFill
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
 from openpyxl.utils import get_column_letter
-from openpyxl.formatting.rule import ColorScaleRule, CellIsRule
-from openpyxl.worksheet.table import Table, TableStyleInfo
+from openpyxl.worksheet.table import Table, TableColumn, TableStyleInfo
+from openpyxl.worksheet._write_only import WriteOnlyWorksheet
 from openpyxl.drawing.image import Image
 from openpyxl.worksheet.worksheet import Worksheet
+import copy
+from fnmatch import fnmatchcase
+import numpy as np
+import os
 import pandas as pd
-from charts import ChartGenerator
+import re
+import tempfile
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from charts import ChartGenerator, _warm_renderer, renderer_pool
 from utils import get_legend_df
-
-MATURITY_LEVELS = {
-    "high": 3,
-    "functional": 2,
-    "proof-of-concept": 1,
-    "unproven": 0,
-}
+from formats import (
+    ColumnFormat,
+    apply_column_formats,
+    color_scale_rules,
+    column_widths,
+    excel_frame,
+    excel_values,
+    fill_rules,
+    sign_rules,
+)
+from priority import PriorityRules
+from profiling import stage
+from diff import KEY_COLUMNS, UPDATE_COLUMNS, diff_scans, latest_rows
+from schema import CATEGORY, DATE_COLUMNS, SCORE, is_categorical, parse_dates
+
+# Columns added by compute_dataframe holding a few distinct values, stored as
+# categoricals in low memory mode
+COMPUTED_CATEGORIES = ["Priority", "Status", "Update Cisa", "Update Maturity"]
+
+# Only row of the sheets of an empty frame
+NO_DATA = "No data to display"
+
+# Aggregation rules of group_df joining the values of a group with " | "
+DISTINCT_JOIN = "distinct_join"
+JOIN = "join"
 
 
 class ReportGenerator:
@@ -45,6 +72,15 @@ class ReportGenerator:
         "max": "FFF8696B",
         "mid": "FFFFFFFF",
     }
+    DATE_FORMAT = "YYYY/MM/DD"
+    # Header style of pandas, kept by the streaming writer
+    HEADER_BORDER = Border(
+        left=Side(style="thin"),
+        right=Side(style="thin"),
+        top=Side(style="thin"),
+        bottom=Side(style="thin"),
+    )
+    HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="top")
     STYLE = TableStyleInfo(
         name="TableStyleMedium2",
         showFirstColumn=False,
@@ -53,6 +89,58 @@ class ReportGenerator:
         showColumnStripes=True,
     )
 
+    # Rows of a sheet below its header, the Excel limit
+    MAX_SHEET_ROWS = 1048575
+
+    # Charts of the Analysis sheet, in their order: name, method of ChartGenerator
+    # and its arguments, "{score}" standing for the score column of the report
+    CHARTS = [
+        ("cwe", "generate_cwe_chart", {}),
+        ("capec", "generate_capec_chart", {}),
+        (
+            "cve_by_group",
+            "generate_cve_by_group_chart",
+            {"group_columns": ["Domain", "Server", "Priority"]},
+        ),
+        (
+            "mean_cvss_by_domain",
+            "generate_mean_cvss_by_group_chart",
+            {"group_column": "Domain", "score_col": "{score}"},
+        ),
+        (
+            "mean_cvss_by_server",
+            "generate_mean_cvss_by_group_chart",
+            {"group_column": "Server", "score_col": "{score}"},
+        ),
+        (
+            "criticity_by_domain",
+            "generate_criticity_by_group_chart",
+            {"group_column": "Domain"},
+        ),
+        (
+            "criticity_by_server",
+            "generate_criticity_by_group_chart",
+            {"group_column": "Server"},
+        ),
+        (
+            "priority_by_domain",
+            "generate_priority_by_group_chart",
+            {"group_column": "Domain"},
+        ),
+        (
+            "priority_by_server",
+            "generate_priority_by_group_chart",
+            {"group_column": "Server"},
+        ),
+        ("cve_by_date", "generate_cve_by_date_chart", {}),
+        ("cve_by_scan", "generate_cve_by_scan_chart", {}),
+        (
+            "mean_cvss_by_scan",
+            "generate_mean_cvss_by_scan_chart",
+            {"score_col": "{score}"},
+        ),
+    ]
+
     def __init__(
         self,
         data_df,
@@ -63,7 +151,52 @@ class ReportGenerator:
         score_col="CVSS Computed Score",
         groupby=["CVE Code", "Server"],
         date_format="%Y-%m-%d",
+        stream=False,
+        render_jobs=0,
+        compute_jobs=0,
+        chart_cache=None,
+        shard_rows=None,
+        shard_workbooks=False,
+        low_memory=False,
+        priority_rules=None,
+        split_by=None,
+        split_jobs=0,
+        sheets=None,
+        exclude_sheets=None,
+        charts=None,
+        exclude_charts=None,
     ):
+        """
+        :param stream: bool, write the workbooks in a single pass with a write-only
+            workbook instead of writing, loading and formatting them
+        :param render_jobs: int, number of processes exporting the charts, 0 exports
+            them one after another in this process
+        :param compute_jobs: int, number of processes computing the old scans against
+            their predecessor, 0 computes them one after another in this process
+        :param chart_cache: ChartCache storing the rendered charts, default is
+            .chart_cache
+        :param shard_rows: int, maximum number of rows of a sheet, longer sheets are
+            split in shards, default is the Excel limit
+        :param shard_workbooks: bool, write the shards after the first one in
+            companion workbooks instead of the report or synthesis
+        :param low_memory: bool, store the computed columns as categoricals and only
+            keep the columns of the synthesis from the scans
+        :param priority_rules: PriorityRules of the Priority column, default is
+            DEFAULT_PRIORITY_RULES
+        :param split_by: str, column of the scans, generate_reports writes a report
+            by value of the column instead of a single report
+        :param split_jobs: int, number of processes writing the reports of split_by,
+            0 writes them one after another in this process
+        :param sheets: list of the names of the sheets of the report, fnmatch
+            patterns like "old n* CVE Scan" matched regardless of case, default is
+            every sheet
+        :param exclude_sheets: list of the names of the sheets left out of the
+            report, the CVE Scan sheet is only grouped when it is written
+        :param charts: list of the names of the CHARTS of the report, default is
+            every chart
+        :param exclude_charts: list of the names of the CHARTS left out of the
+            report, they are never computed
+        """
         self.dataframe = data_df
         self.cpe_df = cpe_df
         self.patch_df = patch_df
@@ -72,7 +205,32 @@ class ReportGenerator:
         self.score_col = score_col
         self.groupby = groupby
         self.date_format = date_format
-        self.get_sheets()
+        self.stream = stream
+        self.render_jobs = render_jobs
+        self.compute_jobs = compute_jobs
+        self.chart_cache = chart_cache
+        self.shard_rows = min(shard_rows or self.MAX_SHEET_ROWS, self.MAX_SHEET_ROWS)
+        self.shard_workbooks = shard_workbooks
+        self.low_memory = low_memory
+        self.priority_rules = priority_rules
+        self.split_by = split_by
+        self.split_jobs = split_jobs
+        self.sheet_selection = (sheets, exclude_sheets)
+        self.chart_selection = (charts, exclude_charts)
+        chart_names = [name for name, _, _ in self.CHARTS]
+        for option, names, patterns in [
+            ("sheets", self.sheet_names(), sheets),
+            ("exclude_sheets", self.sheet_names(), exclude_sheets),
+            ("charts", chart_names, charts),
+            ("exclude_charts", chart_names, exclude_charts),
+        ]:
+            for pattern in unmatched_patterns(names, patterns):
+                print(
+                    f"Warning: {option} pattern '{pattern}' matches none of "
+                    + ", ".join(names)
+                )
+        with stage("get_sheets", len(data_df)):
+            self.get_sheets()
 
     def get_sheets(self):
         for df in [self.dataframe, self.cpe_df, self.patch_df, self.issue_df]:
@@ -83,24 +241,71 @@ class ReportGenerator:
         for i, df in enumerate(self.old_cve_dfs):
             parse_dataframe(df, format=self.date_format)
 
-        for i, df in enumerate(self.old_cve_dfs):
-            if (
-                "Status" not in self.old_cve_dfs[i].columns
-            ):  # If the status column is present, the dataframe is already computed
-                compute_dataframe(
-                    self.old_cve_dfs[i],
-                    self.old_cve_dfs[i + 1] if i + 1 < len(self.old_cve_dfs) else None,
-                    score_col=self.score_col,
-                    groupby=self.groupby,
+        # If the status column is present, the dataframe is already computed
+        uncomputed = [
+            i for i, df in enumerate(self.old_cve_dfs) if "Status" not in df.columns
+        ]
+        rows = sum(len(self.old_cve_dfs[i]) for i in uncomputed)
+        with stage("compute old scans", rows):
+            if self.compute_jobs and len(uncomputed) > 1:
+                compute_scans(
+                    self.old_cve_dfs,
+                    uncomputed,
+                    self.score_col,
+                    self.compute_jobs,
+                    low_memory=self.low_memory,
+                    priority_rules=self.priority_rules,
                 )
+            else:
+                for i in uncomputed:
+                    compute_dataframe(
+                        self.old_cve_dfs[i],
+                        (
+                            self.old_cve_dfs[i + 1]
+                            if i + 1 < len(self.old_cve_dfs)
+                            else None
+                        ),
+                        score_col=self.score_col,
+                        groupby=self.groupby,
+                        low_memory=self.low_memory,
+                        priority_rules=self.priority_rules,
+                    )
 
-        compute_dataframe(
-            self.dataframe,
-            self.old_cve_dfs[0] if len(self.old_cve_dfs) > 0 else None,
-            score_col=self.score_col,
-            groupby=self.groupby,
-        )
-        self.cve_df = group_df(self.dataframe, self.score_col, groupby=self.groupby)
+        with stage("compute_dataframe", len(self.dataframe)):
+            compute_dataframe(
+                self.dataframe,
+                self.old_cve_dfs[0] if len(self.old_cve_dfs) > 0 else None,
+                score_col=self.score_col,
+                groupby=self.groupby,
+                low_memory=self.low_memory,
+                priority_rules=self.priority_rules,
+            )
+        # The CVE Scan sheet of a split report is grouped by partition
+        if not self.split_by:
+            self.build_sheets()
+
+    def sheet_names(self):
+        """Names of every sheet the report may hold."""
+        names = [
+            "Legende",
+            "CVE Scan",
+            "CPE Scan",
+            "Patch Scan",
+            "Security issues Scan",
+            "Data",
+        ]
+        for i in range(1, len(self.old_cve_dfs) + 1):
+            names.append(f"old n{i} CVE Scan")
+        return names
+
+    def build_sheets(self):
+        self.cve_df = None
+        if selected("CVE Scan", *self.sheet_selection):
+            with stage("group_df") as record:
+                self.cve_df = group_df(
+                    self.dataframe, self.score_col, groupby=self.groupby
+                )
+                record["rows"] = len(self.cve_df)
         self.sheets = {
             "CVE Scan": self.cve_df,
             "CPE Scan": self.cpe_df,
@@ -110,6 +315,55 @@ class ReportGenerator:
         }
         for i, old_cve_df in enumerate(self.old_cve_dfs, start=1):
             self.sheets.update({f"old n{i} CVE Scan": old_cve_df})
+        self.sheets = {
+            sheet_name: df
+            for sheet_name, df in self.sheets.items()
+            if selected(sheet_name, *self.sheet_selection)
+        }
+
+    def selected_charts(self):
+        return [
+            chart for chart in self.CHARTS if selected(chart[0], *self.chart_selection)
+        ]
+
+    def column_formats(self, df, color_scale_columns):
+        """
+        Declarative formats of the columns of df: conditional rules, number formats
+        and widths, compiled once per sheet by apply_column_formats.
+        """
+        formats = {
+            col: ColumnFormat(width=width) for col, width in column_widths(df).items()
+        }
+
+        def add(column_name, rules=(), number_format=None):
+            if column_name in formats:
+                formats[column_name].rules.extend(rules)
+                if number_format:
+                    formats[column_name].number_format = number_format
+
+        add("Criticity", fill_rules(self.CRITICITY_COLORS))
+        add("Priority", fill_rules(self.PRIORITY_COLORS))
+        add("Maturity", fill_rules(self.MATURITY_COLORS))
+        for col_name in color_scale_columns:
+            add(col_name, color_scale_rules(1, 4, 100, self.COLOR_SCALE))
+        add("Score EPSS", color_scale_rules(1, 0.05, 100, self.COLOR_SCALE))
+        add("Total", color_scale_rules(1, 20, 100, self.COLOR_SCALE))
+        add("CVE Number", color_scale_rules(1, 20, 100, self.COLOR_SCALE))
+        add("Cisa Reference", fill_rules({"Yes": "00B050"}))
+        add("Update Cisa", fill_rules({"Added": "00B050", "Removed": "FF7575"}))
+        add(
+            "Update EPSS",
+            sign_rules("FF7575", "00B050"),
+            number_format="+0.00%;-0.00%;0.00%",
+        )
+        add(
+            "Update CVSS",
+            sign_rules("FF7575", "00B050"),
+            number_format="+0.00;-0.00;0.00",
+        )
+        for date_col in DATE_COLUMNS:
+            add(date_col, number_format=self.DATE_FORMAT)
+        return formats
 
     def apply_conditional_formatting(
         self, ws, df, color_scale_columns=["CVSS Computed Score"]
@@ -117,155 +371,80 @@ class ReportGenerator:
         if not isinstance(color_scale_columns, list):
             color_scale_columns = [color_scale_columns]
 
-        def apply_cell_rule(column_name, criteria_colors):
-            if column_name in df.columns:
-                col_letter = get_column_letter(df.columns.get_loc(column_name) + 1)
-                for criterion, color in criteria_colors.items():
-                    ws.conditional_formatting.add(
-                        f"{col_letter}2:{col_letter}{ws.max_row}",
-                        CellIsRule(
-                            operator="equal",
-                            formula=[f'"{criterion}"'],
-                            stopIfTrue=True,
-                            fill=PatternFill(
-                                start_color=color, end_color=color, fill_type="solid"
-                            ),
-                        ),
-                    )
-
-        def apply_color_scale(column_name, start_value, mid_value, end_value):
-            if column_name in df.columns:
-                col_letter = get_column_letter(df.columns.get_loc(column_name) + 1)
-                ws.conditional_formatting.add(
-                    f"{col_letter}2:{col_letter}{ws.max_row}",
-                    ColorScaleRule(
-                        start_type="percent",
-                        start_value=start_value,
-                        start_color=self.COLOR_SCALE["min"],
-                        mid_type="num",
-                        mid_value=mid_value,
-                        mid_color=self.COLOR_SCALE["mid"],
-                        end_type="percent",
-                        end_value=end_value,
-                        end_color=self.COLOR_SCALE["max"],
-                    ),
-                )
-
-        def apply_number_format(column_name, number_format):
-            if column_name in df.columns:
-                col_letter = get_column_letter(df.columns.get_loc(column_name) + 1)
-                for row in range(2, ws.max_row + 1):
-                    ws[f"{col_letter}{row}"].number_format = number_format
-
         for col_num in range(1, df.shape[1] + 1):
             ws[f"{get_column_letter(col_num)}1"].font = Font(color="FFFFFF")
 
-        apply_cell_rule("Criticity", self.CRITICITY_COLORS)
-        apply_cell_rule("Priority", self.PRIORITY_COLORS)
-        apply_cell_rule("Maturity", self.MATURITY_COLORS)
+        formats = self.column_formats(df, color_scale_columns)
+        apply_column_formats(ws, df, formats, ws.max_row)
+        for col, column_format in formats.items():
+            # Dates are formatted by the ExcelWriter while they are written, and
+            # openpyxl has no column level format for the cells already written
+            if column_format.number_format in (None, self.DATE_FORMAT):
+                continue
+            col_num = df.columns.get_loc(col) + 1
+            for (cell,) in ws.iter_rows(min_row=2, min_col=col_num, max_col=col_num):
+                cell.number_format = column_format.number_format
 
-        for col_name in color_scale_columns:
-            apply_color_scale(col_name, 1, 4, 100)
-
-        apply_color_scale("Score EPSS", 1, 0.05, 100)
-        apply_color_scale("Total", 1, 20, 100)
-        apply_color_scale("CVE Number", 1, 20, 100)
-        apply_cell_rule("Cisa Reference", {"Yes": "00B050"})
-        apply_number_format("Update CVSS", "+0.00;-0.00;0.00")
-        apply_number_format("Update EPSS", "+0.00%;-0.00%;0.00%")
-
-        for date_col in ["Published Date", "Last Reviewed Date"]:
-            apply_number_format(date_col, "YYYY/MM/DD")
-
-        if "Update Cisa" in df.columns:
-            col_letter = get_column_letter(df.columns.get_loc("Update Cisa") + 1)
-            ws.conditional_formatting.add(
-                f"{col_letter}2:{col_letter}{ws.max_row}",
-                CellIsRule(
-                    operator="equal",
-                    formula=['"Added"'],
-                    stopIfTrue=True,
-                    fill=PatternFill(
-                        start_color="00B050", end_color="00B050", fill_type="solid"
-                    ),
-                ),
-            )
-            ws.conditional_formatting.add(
-                f"{col_letter}2:{col_letter}{ws.max_row}",
-                CellIsRule(
-                    operator="equal",
-                    formula=['"Removed"'],
-                    stopIfTrue=True,
-                    fill=PatternFill(
-                        start_color="FF7575", end_color="FF7575", fill_type="solid"
-                    ),
-                ),
-            )
+    def stream_sheet(self, wb, sheet_name, df, color_scale_columns):
+        """
+        Write df in a sheet of the write-only workbook wb with its table and formats.
+        Rows are sent to the file as they are produced, so the sheet is written in a
+        single pass and never held in memory.
+        """
+        print(f"Writing {sheet_name} sheet")
+        ws = wb.create_sheet(sheet_name)
 
-        for update_col in ["Update EPSS", "Update CVSS"]:
-            if update_col in df.columns:
-                col_letter = get_column_letter(df.columns.get_loc(update_col) + 1)
-                ws.conditional_formatting.add(
-                    f"{col_letter}2:{col_letter}{ws.max_row}",
-                    CellIsRule(
-                        operator="greaterThan",
-                        formula=[0],
-                        stopIfTrue=True,
-                        font=Font(color="FF7575"),
-                    ),
-                )
-                ws.conditional_formatting.add(
-                    f"{col_letter}2:{col_letter}{ws.max_row}",
-                    CellIsRule(
-                        operator="lessThan",
-                        formula=[0],
-                        stopIfTrue=True,
-                        font=Font(color="00B050"),
-                    ),
-                )
+        # Widths and formats have to be set before the first row is written
+        formats = self.column_formats(df, color_scale_columns)
+        apply_column_formats(ws, df, formats, len(df) + 1)
+        self.add_table_from_df(ws, df, sheet_name)
 
-        max_width = 25
+        header = []
         for col in df.columns:
-            col_letter = get_column_letter(df.columns.get_loc(col) + 1)
-            max_length = max(
-                len(str(ws[f"{col_letter}{row}"].value))
-                for row in range(1, min(50, ws.max_row + 1))
-            )
-            ws.column_dimensions[col_letter].width = (
-                min(max_length, max_width) + 5
-                if not col.startswith("Description")
-                else max_length + 5
-            )
+            cell = WriteOnlyCell(ws, value=str(col))
+            cell.font = Font(color="FFFFFF")
+            cell.border = self.HEADER_BORDER
+            cell.alignment = self.HEADER_ALIGNMENT
+            header.append(cell)
+        ws.append(header)
+
+        df = excel_frame(df)
+        columns = [excel_values(df[col]) for col in df.columns]
+        number_formats = {
+            df.columns.get_loc(col): column_format.number_format
+            for col, column_format in formats.items()
+            if column_format.number_format
+        }
+        for row in zip(*columns):
+            if number_formats:
+                row = list(row)
+                for col_num, number_format in number_formats.items():
+                    cell = WriteOnlyCell(ws, value=row[col_num])
+                    cell.number_format = number_format
+                    row[col_num] = cell
+            ws.append(row)
+        return ws
+
+    def apply_charts(self, ws):
+        if not self.render_jobs:
+            self.place_charts(ws)
+            return
+        with renderer_pool(self.render_jobs) as renderer:
+            self.place_charts(ws, renderer)
 
-    def apply_charts(self, ws, by_scans=True):
-        chart_generator = ChartGenerator(self.dataframe, self.old_cve_dfs, "charts")
-        images = [
-            chart_generator.generate_cwe_chart(),
-            chart_generator.generate_capec_chart(),
-            # chart_generator.generate_cve_by_group_chart(
-            #     group_columns=["Server", "Priority"]
-            # ),
-            chart_generator.generate_cve_by_group_chart(
-                group_columns=["Domain", "Server", "Priority"]
-            ),
-            chart_generator.generate_mean_cvss_by_group_chart(
-                group_column="Domain", score_col=self.score_col
-            ),
-            chart_generator.generate_mean_cvss_by_group_chart(
-                group_column="Server", score_col=self.score_col
-            ),
-            chart_generator.generate_criticity_by_group_chart(group_column="Domain"),
-            chart_generator.generate_criticity_by_group_chart(group_column="Server"),
-            chart_generator.generate_priority_by_group_chart(group_column="Domain"),
-            chart_generator.generate_priority_by_group_chart(group_column="Server"),
-            chart_generator.generate_cve_by_date_chart(),
-            chart_generator.generate_cve_by_scan_chart() if by_scans else None,
-            (
-                chart_generator.generate_mean_cvss_by_scan_chart(self.score_col)
-                if by_scans
-                else None
-            ),
-        ]
+    def place_charts(self, ws, renderer=None):
+        chart_generator = ChartGenerator(
+            self.dataframe, self.old_cve_dfs, self.chart_cache, renderer=renderer
+        )
+        images = []
+        for _, method, kwargs in self.selected_charts():
+            kwargs = {
+                key: self.score_col if value == "{score}" else value
+                for key, value in kwargs.items()
+            }
+            images.append(getattr(chart_generator, method)(**kwargs))
+        # Images are placed in the order of the list, whatever the export order
+        chart_generator.wait()
         idx = 0
         for image in images:
             if not image:
@@ -279,11 +458,22 @@ class ReportGenerator:
 
     def add_table_from_df(self, ws: Worksheet, df: pd.DataFrame, name):
         table = Table(
-            displayName=name.replace(" ", "_"),
+            displayName=re.sub(r"[^0-9A-Za-z_.]", "_", name),
             ref=f"A1:{get_column_letter(df.shape[1])}{len(df)+1}",
         )
         table.tableStyleInfo = self.STYLE
-        ws.add_table(table)
+        if isinstance(ws, WriteOnlyWorksheet):
+            # The columns are named after the header cells when the workbook is
+            # saved, which a write-only sheet does not keep
+            table.tableColumns = [
+                TableColumn(id=i + 1, name=str(col)) for i, col in enumerate(df.columns)
+            ]
+            with warnings.catch_warnings():
+                # Warned for every write-only sheet, even with the columns added
+                warnings.filterwarnings("ignore", "In write-only mode")
+                ws.add_table(table)
+        else:
+            ws.add_table(table)
 
     def write_to_excel_with_loader(self, df, sheet_name, writer):
         from tqdm import tqdm
@@ -304,40 +494,192 @@ class ReportGenerator:
     def write_to_excel(self, df, sheet_name, writer):
         if df is not None:
             print(f"Writing {sheet_name} sheet")
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
+            excel_frame(df).to_excel(writer, sheet_name=sheet_name, index=False)
+
+    def partitions(self):
+        """
+        ReportGenerator of every value of split_by in the scan, holding the rows of
+        the scans with this value. The scans are already computed, so only the CVE
+        Scan sheet of a partition is grouped. The exports without the split_by
+        column, CPE and Patch, are kept whole, like the old scans without it, and
+        the old scans without the value are left out.
+
+        :return: list of (value, ReportGenerator)
+        """
+        column = self.split_by
+        if column not in self.dataframe:
+            raise ValueError(f"No {column} column to split the reports by")
+        frames = [self.dataframe, self.issue_df] + self.old_cve_dfs
+        indices = [
+            df.groupby(column, observed=True).indices if column in df else None
+            for df in frames
+        ]
+        missing = self.dataframe[column].isna().sum()
+        if missing:
+            print(f"{missing} rows without {column} are left out of the reports")
+        partitions = []
+        for value, rows in indices[0].items():
+            partition = copy.copy(self)
+            partition.split_by = None
+            partition.dataframe = take_rows(self.dataframe, rows)
+            if indices[1] is not None:
+                partition.issue_df = take_rows(self.issue_df, indices[1].get(value, []))
+            partition.old_cve_dfs = [
+                df if df_indices is None else take_rows(df, df_indices[value])
+                for df, df_indices in zip(self.old_cve_dfs, indices[2:])
+                if df_indices is None or value in df_indices
+            ]
+            partition.build_sheets()
+            partitions.append((value, partition))
+        return partitions
+
+    def generate_split_reports(self, name, date):
+        """Generate the report and synthesis of every partition of split_by."""
+        partitions = [
+            (f"{name}_{re.sub(r'[^0-9A-Za-z_.-]', '_', str(value))}", partition)
+            for value, partition in self.partitions()
+        ]
+        print(f"Generating {len(partitions)} reports by {self.split_by}")
+        failed = []
+        with stage("generate_split_reports", len(self.dataframe)):
+            if self.split_jobs:
+                with ProcessPoolExecutor(
+                    self.split_jobs, initializer=_warm_renderer
+                ) as pool:
+                    futures = {
+                        partition_name: pool.submit(
+                            partition.generate_reports, partition_name, date
+                        )
+                        for partition_name, partition in partitions
+                    }
+                    for partition_name, future in futures.items():
+                        try:
+                            future.result()
+                        except Exception as e:
+                            print(
+                                f"Error generating the report of {partition_name}: {e}"
+                            )
+                            failed.append(partition_name)
+            else:
+                for partition_name, partition in partitions:
+                    try:
+                        partition.generate_reports(partition_name, date)
+                    except Exception as e:
+                        print(f"Error generating the report of {partition_name}: {e}")
+                        failed.append(partition_name)
+        # The other partitions are generated, but the run fails
+        if failed:
+            raise RuntimeError(
+                f"{len(failed)}/{len(partitions)} split reports failed: "
+                + ", ".join(failed)
+            )
+
+    def generate_reports(self, name, date):
+        """
+        Generate the report AUDIT_{name}_{date}.xlsx and its synthesis, or those of
+        every partition with split_by.
+        """
+        if self.split_by:
+            self.generate_split_reports(name, date)
+            return
+        self.generate_report(f"AUDIT_{name}", date)
+        self.generate_synthesis(
+            f"AUDIT_SYNTHESIS_{name}",
+            date,
+            subset=["Server", "CVE Code", "Product"],
+            groupby=["CVE Code", "Server", "Status"],
+        )
 
     def generate_report(self, filename, date):
-        filename = f"{filename}_{date}.xlsx"
-        self.sheets = {"Legende": get_legend_df(date), **self.sheets}
-        with pd.ExcelWriter(filename, engine="openpyxl") as writer:
-            for sheet_name, df in self.sheets.items():
+        if selected("Legende", *self.sheet_selection):
+            self.sheets = {"Legende": get_legend_df(date), **self.sheets}
+        workbooks = self.shard_sheets(self.sheets, f"{filename}_{date}")
+        rows = sum(len(df) for df in self.sheets.values() if df is not None)
+        with stage("generate_report", rows):
+            for i, (path, sheets) in enumerate(workbooks):
+                self.write_workbook(path, sheets, charts=i == 0)
+
+    def shard_sheets(self, sheets, filename):
+        """
+        Split the sheets longer than shard_rows into "Name (1)", "Name (2)", ...
+        sheets, or with shard_workbooks into companion workbooks filename_2.xlsx, ...
+        holding the following shards. Shards are row slices, so every shard gets its
+        own table and formats and the frame is never written at once.
+
+        :return: list of (path, sheets) of the workbooks, filename.xlsx first
+        """
+        workbooks = [{}]
+        for sheet_name, df in sheets.items():
+            if df is None or len(df) <= self.shard_rows:
+                workbooks[0][sheet_name] = df
+                continue
+            starts = range(0, len(df), self.shard_rows)
+            print(f"Splitting {sheet_name} sheet into {len(starts)} shards")
+            for shard, start in enumerate(starts, start=1):
+                index = shard - 1 if self.shard_workbooks else 0
+                while len(workbooks) <= index:
+                    workbooks.append({})
+                workbooks[index][f"{sheet_name} ({shard})"] = df.iloc[
+                    start : start + self.shard_rows
+                ]
+        paths = [f"{filename}.xlsx"] + [
+            f"{filename}_{i}.xlsx" for i in range(2, len(workbooks) + 1)
+        ]
+        return list(zip(paths, workbooks))
+
+    def write_workbook(self, filename, sheets, charts=True):
+        rows = sum(len(df) for df in sheets.values() if df is not None)
+        if self.stream:
+            wb = Workbook(write_only=True)
+            with stage("write", rows):
+                for sheet_name, df in sheets.items():
+                    if df is not None:
+                        self.stream_sheet(wb, sheet_name, df, [self.score_col])
+            if charts and self.selected_charts():
+                with stage("charts"):
+                    graph_sheet = wb.create_sheet("Analysis")
+                    self.apply_charts(graph_sheet)
+            print("Saving file (this may take a while)")
+            with stage("save", rows):
+                wb.save(filename)
+            return
+
+        with stage("write", rows), pd.ExcelWriter(
+            filename, engine="openpyxl", datetime_format=self.DATE_FORMAT
+        ) as writer:
+            for sheet_name, df in sheets.items():
                 self.write_to_excel(df, sheet_name, writer)
             print("Saving file (this may take a while)")
 
         try:
-            wb = load_workbook(filename)
+            with stage("load", rows):
+                wb = load_workbook(filename)
         except Exception as e:
             print(f"Error loading workbook: {e}")
             return
 
-        for sheet_name, df in self.sheets.items():
+        for sheet_name, df in sheets.items():
             print(f"Applying formatting to {sheet_name} sheet")
-            try:
-                ws = wb[sheet_name]
-                print(ws)
-                self.add_table_from_df(ws, df, sheet_name)
-            except:
-                print(f"Sheet {sheet_name} not found")
-            if df is not None:
-                ws = wb[sheet_name]
-                self.apply_conditional_formatting(
-                    ws, df, color_scale_columns=[self.score_col]
-                )
+            with stage(f"formatting {sheet_name}", None if df is None else len(df)):
+                try:
+                    ws = wb[sheet_name]
+                    print(ws)
+                    self.add_table_from_df(ws, df, sheet_name)
+                except:
+                    print(f"Sheet {sheet_name} not found")
+                if df is not None:
+                    ws = wb[sheet_name]
+                    self.apply_conditional_formatting(
+                        ws, df, color_scale_columns=[self.score_col]
+                    )
 
-        graph_sheet = wb.create_sheet("Analysis")
-        self.apply_charts(graph_sheet, by_scans=len(self.sheets) > 5)
+        if charts and self.selected_charts():
+            with stage("charts"):
+                graph_sheet = wb.create_sheet("Analysis")
+                self.apply_charts(graph_sheet)
         print("Saving file (this may take a while)")
-        wb.save(filename)
+        with stage("save", rows):
+            wb.save(filename)
 
     def generate_synthesis(
         self,
@@ -348,137 +690,213 @@ class ReportGenerator:
     ):
         """
         Generate a single excel file with all the CVE from every scan in a single sheet
-        if a cve is present in multiple scans, the latest scan will be kept
+        if a cve is present in multiple scans, the latest scan will be kept. The sheet
+        is sharded like the ones of the report
         """
-        filename = f"{filename}_{date}.xlsx"
-        synthesis_df = pd.concat([self.dataframe] + self.old_cve_dfs)
-        groupby = [col for col in groupby if col in list(synthesis_df.columns)]
-        # If a CVE is in the old scan but not in the self.dataframe, it means it's been fixed
-        # The comparison is done on the rows CVE Code, Server, and Product
-        # Set its status to "Fixed"
-        keys = ["CVE Code", "Server", "Product"]
-        for i, old_cve_df in enumerate(self.old_cve_dfs):
-            fixed_cves = old_cve_df[
-                ~old_cve_df.set_index(keys).index.isin(
-                    self.dataframe.set_index(keys).index
-                )
-            ]
-            fixed_cves_index = synthesis_df.set_index(keys).index.isin(
-                fixed_cves.set_index(keys).index
+        scans = [self.dataframe] + self.old_cve_dfs
+        with stage("generate_synthesis", sum(len(df) for df in scans)):
+            synthesis_df = self.synthesis_df(scans, subset, groupby)
+            # Sharded like the report, without the Legende and the charts
+            workbooks = self.shard_sheets(
+                {"Synthesis": synthesis_df}, f"{filename}_{date}"
             )
-            synthesis_df.loc[fixed_cves_index, "Status"] = "Fixed"
+            for path, sheets in workbooks:
+                self.write_workbook(path, sheets, charts=False)
+
+    def synthesis_df(self, scans, subset, groupby):
+        # If a CVE is in an old scan but not in self.dataframe, it's been fixed
+        # The comparison is done on the subset rows, CVE Code, Server, and Product
+        columns = None
+        if self.low_memory:
+            # Only the columns kept by group_df are copied from the scans
+            columns = set(subset) | set(groupby)
+            for scan in scans:
+                columns |= set(group_agg(scan.columns, self.score_col, groupby))
+        with stage("latest_rows") as record:
+            synthesis_df = latest_rows(scans, subset, columns)
+            record["rows"] = len(synthesis_df)
+        groupby = [col for col in groupby if col in list(synthesis_df.columns)]
+        with stage("group_df") as record:
+            synthesis_df = group_df(synthesis_df, self.score_col, groupby=groupby)
+            record["rows"] = len(synthesis_df)
+        return synthesis_df
 
-        synthesis_df = synthesis_df.drop_duplicates(subset=subset, keep="first")
-        synthesis_df = group_df(synthesis_df, self.score_col, groupby=groupby)
 
-        with pd.ExcelWriter(
-            filename, engine="openpyxl", date_format="dd/mm/yyyy"
-        ) as writer:
-            synthesis_df.to_excel(writer, sheet_name="Synthesis", index=False)
-        wb = load_workbook(filename)
-        ws = wb["Synthesis"]
-        self.apply_conditional_formatting(
-            ws, synthesis_df, color_scale_columns=[self.score_col]
-        )
-        self.add_table_from_df(ws, synthesis_df, "Synthesis")
-        wb.save(filename)
+def matches(name, pattern):
+    """Whether name matches the fnmatch pattern, regardless of case."""
+    return fnmatchcase(name.lower(), pattern.lower())
 
 
-def get_news_from_scans_vectorized(
-    merged_df: pd.DataFrame, score_col: str
-) -> pd.DataFrame:
-    merged_df["Status"] = "Known"
-    update_cols = ["Update Cisa", "Update EPSS", "Update CVSS", "Update Maturity"]
-    merged_df[update_cols] = ""
-
-    # Define conditions for updates
-    update_conditions = [
-        merged_df["Cisa Reference"] != merged_df["Cisa Reference_old"],
-        merged_df["Maturity"] != merged_df["Maturity_old"],
-        merged_df["Score EPSS"] != merged_df["Score EPSS_old"],
-        merged_df[score_col] != merged_df[score_col + "_old"],
-    ]
+def selected(name, include=None, exclude=None):
+    """
+    Whether name matches one of the fnmatch patterns of include, every name does
+    when it is None, and none of exclude.
+    """
+    if include is not None and not any(matches(name, p) for p in include):
+        return False
+    return not any(matches(name, p) for p in exclude or [])
 
-    # Apply the conditions to set the status
-    merged_df.loc[pd.concat(update_conditions, axis=1).any(axis=1), "Status"] = (
-        "Updated"
-    )
-    merged_df.loc[merged_df[score_col + "_old"].isna(), "Status"] = "New"
-    updated_df = merged_df.loc[~merged_df[score_col + "_old"].isna()]
 
-    if "Cisa Reference" in updated_df.columns:
-        cisa_condition = (
-            updated_df["Cisa Reference"] != updated_df["Cisa Reference_old"]
-        )
-        updated_df.loc[cisa_condition, "Update Cisa"] = updated_df.loc[
-            cisa_condition, "Cisa Reference"
-        ].map({"Yes": "Added", "No": "Removed"})
-
-    if "Score EPSS" in updated_df.columns:
-        score_diff = updated_df["Score EPSS"] - updated_df["Score EPSS_old"]
-        updated_df.loc[score_diff != 0, "Update EPSS"] = score_diff
-
-    if score_col in updated_df.columns:
-        custom_score_diff = updated_df[score_col] - updated_df[score_col + "_old"]
-        updated_df.loc[custom_score_diff != 0, "Update CVSS"] = custom_score_diff
-
-    if "Maturity" in updated_df.columns:
-        maturity_diff = updated_df["Maturity"].map(MATURITY_LEVELS) - updated_df[
-            "Maturity_old"
-        ].map(MATURITY_LEVELS)
-        updated_df.loc[maturity_diff != 0, "Update Maturity"] = (
-            updated_df["Maturity_old"] + " -> " + updated_df["Maturity"]
-        )
+def unmatched_patterns(names, patterns):
+    """Patterns matching none of names, likely misspelled."""
+    return [p for p in patterns or [] if not any(matches(name, p) for name in names)]
 
-    merged_df[update_cols] = updated_df[update_cols]
-    return merged_df
+
+def take_rows(df, rows):
+    """Rows of df at the positions rows, "No data to display" when there is none."""
+    taken = df.iloc[rows].reset_index(drop=True)
+    if taken.empty:
+        mark_empty(taken)
+    return taken
+
+
+def mark_empty(df):
+    """Write "No data to display" in the first cell of an empty frame, in place."""
+    col = df.columns[0]
+    if is_categorical(df[col]):
+        df[col] = df[col].cat.add_categories(NO_DATA)
+    df.loc[0, col] = NO_DATA
 
 
 def compute_dataframe(
-    dataframe, old_df, score_col, groupby=["CVE Code", "Server"]
+    dataframe,
+    old_df,
+    score_col,
+    groupby=["CVE Code", "Server"],
+    low_memory=False,
+    priority_rules=None,
 ) -> pd.DataFrame:
     # Add a new column to the dataframe to calculate the priority
-    dataframe["Priority"] = 6
-    conditions = [
-        dataframe["Cisa Reference"] == "Yes",
-        dataframe["Maturity"] == "high",
-        dataframe["Score EPSS"] >= 0.8,
-        dataframe[score_col] >= 9,
-    ]
-    dataframe.loc[dataframe[score_col] >= 7, "Priority"] -= 1
-    for condition in conditions:
-        dataframe.loc[condition, "Priority"] = 5
-    for condition in conditions:
-        dataframe.loc[condition, "Priority"] -= 1
-
-    dataframe["Priority"] = "P" + dataframe["Priority"].astype(str)
+    priority_rules = priority_rules or PriorityRules()
+    dataframe["Priority"] = priority_rules.evaluate(dataframe, score_col)
 
     # Compare old and actual scan
     if old_df is not None:
-        merged_df = dataframe.merge(
-            old_df,
-            on=["Server", "CVE Code", "Component"],
-            suffixes=("", "_old"),
-            how="left",
-        )
-
-        merged_df = get_news_from_scans_vectorized(merged_df, score_col)
-
-        dataframe["Status"] = merged_df["Status"]
-        update_cols = [col for col in merged_df.columns if col.startswith("Update")]
+        news = diff_scans(dataframe, old_df, score_col)
+        dataframe["Status"] = news["Status"]
         print(dataframe)
-        dataframe.loc[:, update_cols] = merged_df.loc[:, update_cols]
+        dataframe.loc[:, UPDATE_COLUMNS] = news.loc[:, UPDATE_COLUMNS]
+    if low_memory:
+        encode_computed(dataframe)
+
+
+def encode_computed(dataframe):
+    """Convert the COMPUTED_CATEGORIES columns of dataframe to categoricals, in place."""
+    for col in [col for col in COMPUTED_CATEGORIES if col in dataframe.columns]:
+        if not is_categorical(dataframe[col]):
+            dataframe[col] = dataframe[col].astype(CATEGORY)
+
+
+def _compute_scan(path, old_path, score_col, priority_rules=None):
+    """compute_dataframe of the projections of a scan and its predecessor."""
+    from pyarrow import feather
+
+    dataframe = feather.read_table(path, memory_map=True).to_pandas()
+    old_df = None
+    if old_path is not None:
+        old_df = feather.read_table(old_path, memory_map=True).to_pandas()
+    compute_dataframe(dataframe, old_df, score_col, priority_rules=priority_rules)
+    computed = ["Priority", "Status"] + UPDATE_COLUMNS
+    return dataframe[[col for col in computed if col in dataframe.columns]]
+
+
+def compute_scans(
+    scans, indexes, score_col, jobs, low_memory=False, priority_rules=None
+):
+    """
+    compute_dataframe of the scans at indexes against their predecessor, in a pool
+    of jobs processes. A computation only reads the key and compared columns of
+    both scans: they are written once to Arrow files memory mapped by the workers,
+    and only the computed columns are sent back.
+    """
+    priority_rules = priority_rules or PriorityRules()
+    projected = KEY_COLUMNS + ["Cisa Reference", "Maturity", "Score EPSS", score_col]
+    projected += priority_rules.columns(score_col)
+    needed = sorted({j for i in indexes for j in (i, i + 1) if j < len(scans)})
+    with tempfile.TemporaryDirectory() as tmp, ProcessPoolExecutor(jobs) as pool:
+        paths = {}
+        for i in needed:
+            columns = [col for col in dict.fromkeys(projected) if col in scans[i]]
+            paths[i] = os.path.join(tmp, f"scan_{i}.arrow")
+            scans[i][columns].reset_index(drop=True).to_feather(paths[i])
+        futures = {
+            i: pool.submit(
+                _compute_scan, paths[i], paths.get(i + 1), score_col, priority_rules
+            )
+            for i in indexes
+        }
+        for i, future in futures.items():
+            print(f"Computing old scan n{i + 1}")
+            computed = future.result().set_axis(scans[i].index)
+            scans[i]["Priority"] = computed["Priority"]
+            if "Status" in computed.columns:
+                scans[i]["Status"] = computed["Status"]
+                scans[i].loc[:, UPDATE_COLUMNS] = computed.loc[:, UPDATE_COLUMNS]
+            if low_memory:
+                encode_computed(scans[i])
+
+
+def join_by_group(values, group_codes, n_groups, distinct=True, sep=" | "):
+    """
+    Vectorized equivalent of
+    values.groupby(group_codes).agg(lambda x: sep.join(x.astype(str).unique()))
+    (without .unique() when distinct is False).
+
+    The values are factorized, only their distinct strings are built, and the
+    (group, value) pairs are deduplicated and ordered by group then first appearance
+    with numpy, so the only Python loop left is one str.join per group.
+
+    :param group_codes: np.ndarray, group number of every row, negative to skip it
+    """
+    value_codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    # Distinct values may share the same string, like 1 and "1"
+    string_codes, strings = pd.factorize(pd.Index(uniques).astype(str))
+    value_codes = string_codes[value_codes]
+    strings = np.asarray(strings, dtype=object)
+
+    rows = np.flatnonzero(group_codes >= 0)
+    if distinct:
+        pairs = group_codes[rows].astype(np.int64) * len(strings) + value_codes[rows]
+        _, first_rows = np.unique(pairs, return_index=True)
+        rows = rows[np.sort(first_rows)]
+    # Stable sort keeps the order of appearance inside each group
+    rows = rows[np.argsort(group_codes[rows], kind="stable")]
+    groups = group_codes[rows]
+    bounds = np.searchsorted(groups, np.arange(n_groups + 1))
+    pieces = strings[value_codes[rows]].tolist()
+    return [sep.join(pieces[start:end]) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def aggregate(dataframe, groupby, agg):
+    """
+    dataframe.groupby(groupby).agg(agg).reset_index() where agg also accepts the
+    DISTINCT_JOIN and JOIN rules, computed by join_by_group.
+    """
+    grouped = dataframe.groupby(groupby, observed=True)
+    joins = {col: rule for col, rule in agg.items() if rule in (DISTINCT_JOIN, JOIN)}
+    others = {col: rule for col, rule in agg.items() if col not in joins}
+    if others:
+        result = grouped.agg(others).reset_index()
+    else:
+        result = grouped.size().reset_index()[groupby]
+    if joins:
+        group_codes = grouped.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+        for col, rule in joins.items():
+            result[col] = join_by_group(
+                dataframe[col], group_codes, len(result), distinct=rule == DISTINCT_JOIN
+            )
+    return result[list(groupby) + list(agg)]
 
 
-def group_df(dataframe, score_col, groupby=["CVE Code", "Server"]):
-    clone = dataframe.copy()
+def group_agg(columns, score_col, groupby):
+    """Aggregation rules of group_df for the columns of a frame."""
     base_agg = {
         # Join the servers names with a pipe, but once by servers names (no duplicates)
-        "Server": lambda x: " | ".join(x.astype(str).unique()),
-        "Component": lambda x: " | ".join(x.astype(str).unique()),
-        "Product": lambda x: " | ".join(x.astype(str).unique()),
-        "Version": lambda x: " | ".join(x.astype(str).unique()),
-        "Patch": lambda x: " | ".join(x.astype(str)),
+        "Server": DISTINCT_JOIN,
+        "Component": DISTINCT_JOIN,
+        "Product": DISTINCT_JOIN,
+        "Version": DISTINCT_JOIN,
+        "Patch": JOIN,
         "Criticity": "first",
         "Priority": "first",
         "Score EPSS": "first",
@@ -530,22 +948,29 @@ def group_df(dataframe, score_col, groupby=["CVE Code", "Server"]):
     agg = {}
     for obj in [base_agg, score_agg, optional_agg]:
         for col, rule in obj.items():
-            if (
-                col in list(clone.columns)
-                and col not in useless_cols
-                and col not in groupby
-            ):
+            if col in list(columns) and col not in useless_cols and col not in groupby:
                 agg[col] = rule
-    clone = clone.groupby(groupby).agg(agg).reset_index()
-    clone.sort_values(
+    return agg
+
+
+def group_df(dataframe, score_col, groupby=["CVE Code", "Server"]):
+    # aggregate only reads dataframe, it is not copied
+    grouped = aggregate(
+        dataframe, groupby, group_agg(dataframe.columns, score_col, groupby)
+    )
+    grouped.sort_values(
         by=["Priority", "Score EPSS"], ascending=[True, False], inplace=True
     )
-    return clone
+    return grouped
 
 
 def parse_dataframe(df, format="%Y-%m-%d"):
+    # Frames loaded from the cache are already parsed
+    if df.attrs.get("date_format") == format:
+        return
+    df.attrs["date_format"] = format
     if df.empty:
-        df.loc[0, df.columns[0]] = "No data to display"
+        mark_empty(df)
         return
     numeric_cols = [
         "CVSS Score",
@@ -564,12 +989,8 @@ def parse_dataframe(df, format="%Y-%m-%d"):
     if "Patch" in list(df.columns):
         df["Patch"] = df["Patch"].replace(replace_dict)
 
-    df[numeric_cols] = df[numeric_cols].astype(float)
-    date_cols = [
-        "Published Date",
-        "Last Reviewed Date",
-    ]
-    date_cols = [col for col in date_cols if col in list(df.columns)]
+    df[numeric_cols] = df[numeric_cols].astype(SCORE)
+    # Missing dates stay NaT, they are written "Unknown" by excel_frame
+    date_cols = [col for col in DATE_COLUMNS if col in list(df.columns)]
     for col in date_cols:
-        df[col] = pd.to_datetime(df[col], errors="coerce", format=format)
-        df[col] = df[col].fillna("Unknown")
+        df[col] = parse_dates(df[col], format)
@@ -0,0 +1,132 @@
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+try:
+    import pyarrow  # noqa: F401
+
+    TEXT = "string[pyarrow]"
+except ImportError:
+    TEXT = "object"
+
+CATEGORY = "category"
+SCORE = "float32"
+
+# Version of the registry, part of the cache key so that frames cached with older
+# dtypes are not reused
+SCHEMA_VERSION = 1
+
+# Columns of the Cyberwatch exports, the CVE, CPE, Patch and Security Issue exports
+# share the same names for the same data.
+# Low cardinality columns are categoricals, long texts are Arrow backed strings.
+# Scores are read as strings because of the "Undefined"/"None" values, they are cast
+# to SCORE by parse_dataframe once those are replaced.
+COLUMN_TYPES = {
+    "Domain": CATEGORY,
+    "Surface": CATEGORY,
+    "Server": CATEGORY,
+    "Criticity": CATEGORY,
+    "Component": CATEGORY,
+    "Product": CATEGORY,
+    "Version": CATEGORY,
+    "Maturity": CATEGORY,
+    "Cisa Reference": CATEGORY,
+    "Priority": CATEGORY,
+    "CVE Code": TEXT,
+    "Content": TEXT,
+    "Vector": TEXT,
+    "Environmental Vector": TEXT,
+    "Temporal Vector": TEXT,
+    "CWE Code": TEXT,
+    "Related CWEs": TEXT,
+    "Related CAPECs": TEXT,
+    "Related ATK": TEXT,
+    "CertFR References": TEXT,
+}
+
+SCORE_COLUMNS = [
+    "CVSS Score",
+    "CVSS Temporal Score",
+    "CVSS Environmental Score",
+    "CVSS Computed Score",
+    "Score EPSS",
+]
+
+DATE_COLUMNS = ["Published Date", "Last Reviewed Date"]
+
+# Long texts only shown in the raw Data sheets, never used by a synthesis or a chart
+VERBOSE_COLUMNS = [
+    "Content",
+    "Vector",
+    "Environmental Vector",
+    "Temporal Vector",
+]
+
+
+def read_csv_kwargs(drop_verbose=False):
+    """Keyword arguments of pd.read_csv declaring the dtypes and the projection."""
+    kwargs = {"dtype": COLUMN_TYPES}
+    if drop_verbose:
+        kwargs["usecols"] = lambda col: col not in VERBOSE_COLUMNS
+    return kwargs
+
+
+def cache_tag(drop_verbose=False):
+    """Identify the frames produced by read_csv_kwargs in the parsed csv cache."""
+    return f"schema-{SCHEMA_VERSION}" + ("-lean" if drop_verbose else "")
+
+
+def widen_scores(series):
+    """
+    Cast a SCORE series back to float64 with the precision of the export, so 7,3 is
+    written 7.3 and not 7.300000190734863.
+    """
+    if series.dtype != SCORE:
+        return series
+    return series.astype("float64").round(6)
+
+
+def widen_frame(df):
+    """Shallow copy of df with every SCORE column widened back to float64."""
+    score_cols = [col for col in df.columns if df[col].dtype == SCORE]
+    if not score_cols:
+        return df
+    df = df.copy(deep=False)
+    for col in score_cols:
+        df[col] = widen_scores(df[col])
+    return df
+
+
+def parse_dates(series, format):
+    """
+    pd.to_datetime of series, NaT for the values missing or not matching format.
+    The exports repeat the same dates on many rows, each distinct value is parsed
+    once.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    codes, uniques = pd.factorize(series)
+    dates = pd.to_datetime(pd.Index(uniques), errors="coerce", format=format)
+    dates = dates.take(codes, allow_fill=True, fill_value=pd.NaT)
+    return pd.Series(dates, index=series.index, name=series.name)
+
+
+def is_categorical(series):
+    return isinstance(series.dtype, pd.CategoricalDtype)
+
+
+def concat_frames(frames, ignore_index=False):
+    """
+    pd.concat keeping categoricals as such, pandas falls back to object as soon as
+    the frames do not share the exact same categories.
+    """
+    for col in frames[0].columns:
+        if not is_categorical(frames[0][col]):
+            continue
+        columns = [frame[col] for frame in frames if col in frame.columns]
+        if not all(is_categorical(column) for column in columns):
+            continue
+        categories = union_categoricals(columns, sort_categories=True).categories
+        for frame in frames:
+            if col in frame.columns:
+                frame[col] = frame[col].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=ignore_index)
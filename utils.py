@@ -1,6 +1,25 @@
 from prompt_toolkit import prompt
 from prompt_toolkit.completion import PathCompleter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import hashlib
+import io
+import os
+import sys
 import pandas as pd
+from schema import cache_tag, concat_frames, read_csv_kwargs
+
+# Path reading the csv from the standard input
+STDIN = "-"
+
+# Compressions of the standard input, by magic number. Files are decompressed by
+# pandas from their extension (.gz, .zst, .bz2, .xz, .zip), while they are parsed
+COMPRESSION_MAGICS = {
+    b"\x1f\x8b": "gzip",
+    b"\x28\xb5\x2f\xfd": "zstd",
+    b"BZh": "bz2",
+    b"\xfd7zXZ\x00": "xz",
+}
 
 
 class Args:
@@ -13,17 +32,19 @@ class Args:
         self.value = value
 
 
-def get_df_interactive():
-    data_df = read_csv_file_from_prompt("CVE csv path: ")
-    cpe_df = read_csv_file_from_prompt("CPE csv path: ")
-    patch_df = read_csv_file_from_prompt("Patch csv path: ")
-    issue_df = read_csv_file_from_prompt("SecIssue csv path: ")
+def get_df_interactive(**read_options):
+    data_df = read_csv_file_from_prompt("CVE csv path: ", **read_options)
+    cpe_df = read_csv_file_from_prompt("CPE csv path: ", **read_options)
+    patch_df = read_csv_file_from_prompt("Patch csv path: ", **read_options)
+    issue_df = read_csv_file_from_prompt("SecIssue csv path: ", **read_options)
 
     old_cve_dfs = []
     while True:
         try:
             old_cve_df = read_csv_file_from_prompt(
-                f"Old CVE csv path {len(old_cve_dfs)+1}: ", is_needed=False
+                f"Old CVE csv path {len(old_cve_dfs)+1}: ",
+                is_needed=False,
+                **read_options,
             )
             if old_cve_df is None:
                 break
@@ -34,27 +55,52 @@ def get_df_interactive():
     return data_df, cpe_df, patch_df, issue_df, old_cve_dfs
 
 
-def get_df(data_df_path, cpe_df_path, patch_df_path, issue_df_path, old_cve_dfs_paths):
-    data_df = read_csv_file_from_path(data_df_path)
-    cpe_df = read_csv_file_from_path(cpe_df_path)
-    patch_df = read_csv_file_from_path(patch_df_path)
-    issue_df = read_csv_file_from_path(issue_df_path)
+def get_df(
+    data_df_path,
+    cpe_df_path,
+    patch_df_path,
+    issue_df_path,
+    old_cve_dfs_paths,
+    jobs=None,
+    **read_options,
+):
+    """
+    Read every csv concurrently, at most jobs at once (default is one per cpu).
+    Parsing mostly runs in the C parser, which releases the GIL, so threads are enough
+    and the frames do not have to be sent back from other processes.
+    """
+
+    def read(path):
+        return read_csv_file_from_path(path, **read_options)
 
-    old_cve_dfs = []
     if "," in old_cve_dfs_paths:
-        for path in old_cve_dfs_paths.split(","):
+        old_paths = old_cve_dfs_paths.split(",")
+    elif old_cve_dfs_paths:
+        old_paths = [old_cve_dfs_paths]
+    else:
+        old_paths = []
+    paths = [data_df_path, cpe_df_path, patch_df_path, issue_df_path] + old_paths
+
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        futures = [executor.submit(read, path) for path in paths]
+        data_df, cpe_df, patch_df, issue_df = [
+            future.result() for future in futures[:4]
+        ]
+
+        old_cve_dfs = []
+        for future in futures[4:]:
             try:
-                old_cve_df = read_csv_file_from_path(path)
-                old_cve_dfs.append(old_cve_df)
+                old_cve_dfs.append(future.result())
             except Exception as e:
+                if "," not in old_cve_dfs_paths:
+                    raise
                 print(f"Error reading old CVE: {e}. Please try again.")
-    elif old_cve_dfs_paths:
-        old_cve_df = read_csv_file_from_path(old_cve_dfs_paths)
-        old_cve_dfs.append(old_cve_df)
     return data_df, cpe_df, patch_df, issue_df, old_cve_dfs
 
 
-def read_csv_file_from_prompt(prompt_text, is_needed=True) -> pd.DataFrame or None:
+def read_csv_file_from_prompt(
+    prompt_text, is_needed=True, **read_options
+) -> pd.DataFrame or None:
     path_completer = PathCompleter(only_directories=False)
     while True:
         path = prompt(prompt_text, completer=path_completer)
@@ -64,17 +110,116 @@ def read_csv_file_from_prompt(prompt_text, is_needed=True) -> pd.DataFrame or No
                 continue
             return None
         try:
-            df = pd.read_csv(
-                path, parse_dates=False, delimiter=";", decimal=",", encoding="utf-8"
-            )
+            df = read_csv_file_from_path(path, **read_options)
             return df
         except Exception as e:
             print(f"Error reading {path}: {e}. Please try again.")
 
 
-def read_csv_file_from_path(path) -> pd.DataFrame:
+def read_csv_file_from_path(
+    path, cache=None, date_format="%Y-%m-%d", chunksize=None, drop_verbose=False
+) -> pd.DataFrame:
+    reader = partial(read_raw_csv, drop_verbose=drop_verbose)
+    if chunksize:
+        reader = partial(
+            read_csv_in_chunks,
+            chunksize=chunksize,
+            date_format=date_format,
+            drop_verbose=drop_verbose,
+        )
+    if path == STDIN:
+        df = read_stdin(reader, date_format)
+    elif cache is not None:
+        df = cache.load(path, date_format, reader, tag=cache_tag(drop_verbose))
+    else:
+        df = reader(path)
+    df.attrs["source"] = path
+    return df
+
+
+class HashingReader(io.RawIOBase):
+    """Stream hashing the bytes read from raw, the hash of cache.file_hash."""
+
+    def __init__(self, raw, salt=""):
+        self.raw = raw
+        self.digest = hashlib.blake2b(digest_size=20)
+        self.digest.update(salt.encode("utf-8"))
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = self.raw.readinto(buffer)
+        if size:
+            self.digest.update(memoryview(buffer)[:size])
+        return size
+
+
+def read_stdin(reader, date_format):
+    """
+    Read the csv piped to the standard input with reader, decompressing it while it
+    is parsed. It cannot be read twice, so the parsed csv cache is not used, but
+    the history key is the hash of the content read, like for a file.
+    """
+    hashing = HashingReader(sys.stdin.buffer, salt=date_format)
+    stream = io.BufferedReader(hashing)
+    head = stream.peek(8)
+    compression = next(
+        (
+            compression
+            for magic, compression in COMPRESSION_MAGICS.items()
+            if head.startswith(magic)
+        ),
+        None,
+    )
+    print(f"Reading csv from stdin{f' ({compression})' if compression else ''}")
+    df = reader(stream, compression=compression)
+    df.attrs["history_key"] = hashing.digest.hexdigest()
+    return df
+
+
+def read_csv_in_chunks(
+    path, chunksize, date_format="%Y-%m-%d", drop_verbose=False, compression="infer"
+) -> pd.DataFrame:
+    """
+    Read the csv by chunks of chunksize rows, each chunk being parsed before the next
+    one is read, so the raw text columns of the whole file are never held at once.
+    """
+    from report import parse_dataframe
+
+    chunks = []
+    with pd.read_csv(
+        path,
+        parse_dates=False,
+        delimiter=";",
+        decimal=",",
+        encoding="utf-8",
+        chunksize=chunksize,
+        compression=compression,
+        **read_csv_kwargs(drop_verbose),
+    ) as reader:
+        for chunk in reader:
+            parse_dataframe(chunk, format=date_format)
+            chunks.append(chunk)
+    if not chunks:
+        df = read_raw_csv(path, drop_verbose=drop_verbose)
+        parse_dataframe(df, format=date_format)
+        return df
+    df = concat_frames(chunks, ignore_index=True)
+    chunks.clear()
+    df.attrs["date_format"] = date_format
+    return df
+
+
+def read_raw_csv(path, drop_verbose=False, compression="infer") -> pd.DataFrame:
     return pd.read_csv(
-        path, parse_dates=False, delimiter=";", decimal=",", encoding="utf-8"
+        path,
+        parse_dates=False,
+        delimiter=";",
+        decimal=",",
+        encoding="utf-8",
+        compression=compression,
+        **read_csv_kwargs(drop_verbose),
     )
 
 
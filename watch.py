@@ -0,0 +1,139 @@
+import os
+import time
+from collections import deque
+from profiling import stage
+from report import ReportGenerator
+from utils import get_df, read_csv_file_from_path
+
+# Exports of a scan, in the order of get_df
+EXPORT_FILES = ["cve.csv", "cpe.csv", "patch.csv", "issue.csv"]
+
+
+class ScanWatcher:
+    """
+    Daemon building the report of every scan dropped in a directory.
+
+    A scan is a sub directory of the watched directory named after its date, the
+    -date of its report, holding cve.csv, cpe.csv, patch.csv and issue.csv. It is
+    taken once its four exports are there and their sizes did not change since the
+    previous check, scans being taken in the order of their names. A scan is
+    reported once: when its report exists, it is only used as an old scan.
+
+    The computed CVE scans of the last reports stay in memory, so a new scan only
+    reads its own exports and is diffed against the previous one, the older scans
+    being already computed. The process keeps its imports, chart renderer and
+    caches from one report to the next.
+    """
+
+    def __init__(
+        self, path, name, read_options, generator_options, window=3, interval=30
+    ):
+        """
+        :param path: str, watched directory
+        :param name: str, -name of the reports
+        :param read_options: dict, keyword arguments of get_df
+        :param generator_options: dict, keyword arguments of ReportGenerator
+        :param window: int, number of old scans kept in memory
+        :param interval: float, seconds between two checks of the directory
+        """
+        self.path = path
+        self.name = name
+        self.read_options = read_options
+        self.generator_options = generator_options
+        self.interval = interval
+        # Computed CVE scans, from the newest to the oldest
+        self.scans = deque(maxlen=window)
+        # Sizes of the exports of every scan seen at the previous check
+        self.sizes = {}
+        # Sizes of the exports of the scans which failed, retried once they change
+        self.failed = {}
+
+    def report_path(self, date):
+        return f"AUDIT_{self.name}_{date}.xlsx"
+
+    def export_paths(self, date):
+        return [os.path.join(self.path, date, filename) for filename in EXPORT_FILES]
+
+    def complete_scans(self):
+        """Sizes of the exports of the scans holding every export, by date."""
+        scans = {}
+        for entry in sorted(os.scandir(self.path), key=lambda entry: entry.name):
+            if not entry.is_dir():
+                continue
+            paths = self.export_paths(entry.name)
+            if all(os.path.isfile(path) for path in paths):
+                scans[entry.name] = tuple(os.path.getsize(path) for path in paths)
+        return scans
+
+    def read(self, date):
+        data_df, cpe_df, patch_df, issue_df, _ = get_df(
+            *self.export_paths(date), "", **self.read_options
+        )
+        return data_df, cpe_df, patch_df, issue_df
+
+    def load_reported(self):
+        """Keep the CVE scans of the last reported scans in memory."""
+        reported = [
+            date
+            for date in self.complete_scans()
+            if os.path.exists(self.report_path(date))
+        ]
+        for date in reported[-self.scans.maxlen :] if self.scans.maxlen else []:
+            print(f"Loading reported scan {date}")
+            data_df = read_csv_file_from_path(
+                self.export_paths(date)[0], **self.read_options
+            )
+            data_df.attrs["watch_date"] = date
+            self.scans.appendleft(data_df)
+
+    def report(self, date):
+        """Generate the report and synthesis of a scan and keep its CVE scan."""
+        print(f"Reporting scan {date}")
+        start = time.perf_counter()
+        with stage(f"scan {date}"):
+            data_df, cpe_df, patch_df, issue_df = self.read(date)
+            generator = ReportGenerator(
+                data_df,
+                cpe_df,
+                patch_df,
+                issue_df,
+                list(self.scans),
+                **self.generator_options,
+            )
+            generator.generate_reports(self.name, date)
+        data_df.attrs["watch_date"] = date
+        self.scans.appendleft(data_df)
+        print(f"Scan {date} reported in {time.perf_counter() - start:.1f}s")
+
+    def check(self):
+        """Report the scans complete and unchanged since the previous check."""
+        sizes = self.complete_scans()
+        for date, scan_sizes in sizes.items():
+            if os.path.exists(self.report_path(date)):
+                continue
+            if (
+                self.sizes.get(date) != scan_sizes
+                or self.failed.get(date) == scan_sizes
+            ):
+                continue
+            if self.scans and date <= self.scans[0].attrs["watch_date"]:
+                print(f"Scan {date} is older than the last reported one, skipped")
+                self.failed[date] = scan_sizes
+                continue
+            try:
+                self.report(date)
+            except Exception as e:
+                print(f"Error reporting scan {date}: {e}")
+                self.failed[date] = scan_sizes
+        self.sizes = sizes
+
+    def run(self):
+        """Watch the directory until interrupted."""
+        self.load_reported()
+        print(f"Watching {self.path} every {self.interval}s, Ctrl+C to stop")
+        try:
+            while True:
+                self.check()
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            print("Stopped watching")